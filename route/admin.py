@@ -1,8 +1,100 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
 
-# Register your models here.
-from .models import FuelStation,RouteRequest,FuelStop
+from .models import FuelStation, RouteRequest, FuelStop
 
-admin.site.register(FuelStation)
-admin.site.register(RouteRequest)
-admin.site.register(FuelStop)
+
+# These tables grow large: joins are done up front, foreign keys are edited
+# by id instead of rendering every station in a <select>, large columns are
+# deferred, and changelists never count the whole table.
+
+
+class BoundedCountPaginator(Paginator):
+    """
+    Paginator that counts at most ``count_limit`` rows, with
+    ``SELECT COUNT(*) FROM (... LIMIT n)``, instead of the whole result.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True,
+                 count_limit=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.count_limit = count_limit
+
+    @cached_property
+    def count(self):
+        if self.count_limit is None:
+            return super().count
+        return self.object_list[:self.count_limit].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist counting rows only up to PAGES_AHEAD pages past the current
+    one; the result count shown is then a lower bound, and the page links
+    reach that far.
+    """
+
+    PAGES_AHEAD = 10
+
+    paginator = BoundedCountPaginator
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        try:
+            page = max(1, int(request.GET.get(PAGE_VAR, 1)))
+        except ValueError:
+            page = 1
+
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            count_limit=(page + self.PAGES_AHEAD) * per_page + 1
+        )
+
+
+@admin.register(FuelStation)
+class FuelStationAdmin(LargeTableAdmin):
+    list_display = (
+        "name", "city", "state", "retail_price", "is_geocoded", "truck_accessible",
+    )
+    list_filter = ("is_geocoded", "truck_accessible", "state")
+    search_fields = ("name", "city", "=opis_id")
+    ordering = ("id",)
+
+
+class FuelStopInline(admin.TabularInline):
+    model = FuelStop
+    extra = 0
+    raw_id_fields = ("station",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("station")
+
+
+@admin.register(RouteRequest)
+class RouteRequestAdmin(LargeTableAdmin):
+    list_display = (
+        "start_location", "end_location", "total_distance_miles", "total_fuel_cost", "created_at",
+    )
+    search_fields = ("start_location", "end_location", "=route_hash")
+    ordering = ("-id",)
+    # A <select> would load every geometry, compressed polyline included
+    raw_id_fields = ("geometry",)
+    inlines = (FuelStopInline,)
+
+    def get_queryset(self, request):
+        # Inline polyline of plans not compacted yet; read on the change form only
+        return super().get_queryset(request).defer("route_polyline")
+
+
+@admin.register(FuelStop)
+class FuelStopAdmin(LargeTableAdmin):
+    list_display = ("__str__", "route", "miles_from_start", "gallons_filled", "cost")
+    # FuelStop.__str__ reads station.name
+    list_select_related = ("route", "station")
+    raw_id_fields = ("route", "station")
+    ordering = ("-route_id", "stop_order")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("route__route_polyline")
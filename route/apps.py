@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class RouteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'route'
+
+    def ready(self):
+        # Opt-in: enable only for server processes, not management commands
+        if getattr(settings, "ROUTE_WARMUP_ON_STARTUP", False):
+            from route.services.warmup import warm_up
+
+            warm_up()
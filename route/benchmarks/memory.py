@@ -0,0 +1,149 @@
+"""
+Peak memory of planning one long route.
+
+Plans each recorded coast-to-coast route in ``fixtures/long_routes.json``
+against a dense synthetic station set and reports the tracemalloc peak of
+the request path (polyline decoding, station projection, stop selection),
+with candidates bounded per route point (ROUTE_CANDIDATES_PER_POINT) and
+unbounded. Exits non-zero when a bounded request is over
+ROUTE_MEMORY_BUDGET_MB.
+
+The fixtures follow the interstate corridors through their major cities
+at OSRM's overview density (a point every ~0.2 miles); they are stored in
+the route cache format so they can also be loaded as cached routes.
+
+    python -m route.benchmarks.memory
+"""
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from pathlib import Path
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "long_routes.json"
+
+# Stations scattered along the fixture corridors, ~2 per 3 corridor miles
+STATIONS = 4500
+MPG = 6.5
+TANK_GALLONS = 120
+
+
+def load_routes():
+    with open(FIXTURES) as file:
+        return json.load(file)
+
+
+def synthetic_snapshot(routes, count=STATIONS, seed=0):
+    """
+    Station snapshot with ``count`` unsaved stations within ~15 miles of
+    the fixture routes: most open around the clock, some with opening
+    hours or not truck accessible.
+    """
+    import polyline
+    from datetime import time as clock
+
+    from route.models import FuelStation
+    from route.services.station_snapshot import StationSnapshot
+
+    rng = random.Random(seed)
+    points = [point for route in routes for point in polyline.decode(route["polyline"])]
+
+    stations = []
+    for pk in range(1, count + 1):
+        lat, lon = rng.choice(points)
+        kind = rng.random()
+
+        stations.append(FuelStation(
+            id=pk,
+            opis_id=pk,
+            name=f"TRAVEL CENTER #{pk}",
+            city="Somewhere",
+            state="XX",
+            retail_price=Decimal(f"{rng.uniform(3.0, 4.5):.3f}"),
+            latitude=lat + rng.gauss(0, 0.1),
+            longitude=lon + rng.gauss(0, 0.1),
+            is_geocoded=True,
+            truck_accessible=kind > 0.03,
+            opens_at=clock(6) if 0.03 < kind < 0.10 else None,
+            closes_at=clock(22) if 0.03 < kind < 0.10 else None,
+        ))
+
+    return StationSnapshot(stations, version="synthetic")
+
+
+def measure(route, snapshot, per_point_limit):
+    """
+    Plan ``route`` against ``snapshot`` and return its peak traced memory
+    in megabytes (above what was allocated before the request), the number
+    of projected candidates and the wall time.
+    """
+    import polyline
+    from django.test import override_settings
+
+    from route.services.optimization_service import RouteOptimizationService
+
+    with override_settings(ROUTE_CANDIDATES_PER_POINT=per_point_limit, ROUTE_PROJECTION_WORKERS=0):
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+
+        route_points = polyline.decode(route["polyline"])
+        candidates = snapshot.within_bbox(*RouteOptimizationService.get_route_bbox(route_points))
+        projected = RouteOptimizationService.project_stations(route_points, candidates)
+        stops, _, _, _ = RouteOptimizationService.calculate_realistic_stops(
+            route["distance_miles"], MPG, TANK_GALLONS, TANK_GALLONS, projected_stations=projected
+        )
+
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "route": route["name"],
+        "per_point_limit": per_point_limit,
+        "candidates": len(projected),
+        "stops": len(stops),
+        "peak_mb": round((peak - baseline) / (1024 * 1024), 1),
+        "seconds": round(seconds, 2),
+    }
+
+
+def main():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "smart_fuel_routing.settings")
+
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+
+    budget_mb = settings.ROUTE_MEMORY_BUDGET_MB
+    limit = settings.ROUTE_CANDIDATES_PER_POINT
+
+    routes = load_routes()
+    snapshot = synthetic_snapshot(routes)
+    failed = False
+
+    print(f"{len(snapshot)} synthetic stations, budget {budget_mb} MB per request")
+    print(f"{'route':<42} {'limit':>6} {'candidates':>11} {'peak MB':>8} {'seconds':>8}")
+
+    for route in routes:
+        for per_point_limit in (limit, None):
+            report = measure(route, snapshot, per_point_limit)
+            over_budget = per_point_limit is not None and report["peak_mb"] > budget_mb
+            failed = failed or over_budget
+
+            print(
+                f"{report['route']:<42} {str(per_point_limit):>6} {report['candidates']:>11} "
+                f"{report['peak_mb']:>8.1f} {report['seconds']:>8.2f}"
+                f"{' OVER BUDGET' if over_budget else ''}"
+            )
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
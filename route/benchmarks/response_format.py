@@ -0,0 +1,138 @@
+"""
+Response encoding benchmark: JSON renderer vs MessagePack.
+
+Renders a synthetic long-haul plan (full-overview polyline, a stop every
+~250 miles) with each renderer and reports server-side render time and
+payload size.
+
+    python -m route.benchmarks.response_format
+"""
+import os
+import random
+import sys
+import timeit
+
+ROUTE_POINTS = 12000
+STOPS = 10
+REPEAT = 5
+NUMBER = 50
+
+
+def synthetic_plan(seed=0):
+    import polyline
+
+    rng = random.Random(seed)
+
+    lat, lon = 32.7767, -96.7970
+    points = []
+    for _ in range(ROUTE_POINTS):
+        lat += rng.uniform(-0.002, 0.004)
+        lon -= rng.uniform(0.0, 0.006)
+        points.append((round(lat, 5), round(lon, 5)))
+
+    stops = []
+    cumulative_cost = 0.0
+    for order in range(1, STOPS + 1):
+        segment_cost = round(rng.uniform(150, 450), 2)
+        cumulative_cost += segment_cost
+        stops.append({
+            "stop_order": order,
+            "station_name": f"TRAVEL CENTER #{rng.randint(100, 9999)}",
+            "city": "Somewhere",
+            "state": "TX",
+            "latitude": rng.uniform(30, 40),
+            "longitude": rng.uniform(-115, -90),
+            "price_per_gallon": round(rng.uniform(3.0, 4.5), 3),
+            "miles_from_start": round(order * 250 + rng.uniform(-40, 40), 2),
+            "distance_travelled_since_last_stop": round(rng.uniform(200, 290), 2),
+            "fuel_used_before_stop": round(rng.uniform(20, 29), 2),
+            "fuel_remaining_on_arrival": round(rng.uniform(1, 20), 2),
+            "gallons_refilled": round(rng.uniform(20, 45), 2),
+            "fuel_after_refill": 50.0,
+            "segment_cost": segment_cost,
+            "cumulative_cost": round(cumulative_cost, 2),
+            "distance_from_route_miles": round(rng.uniform(0, 20), 2),
+        })
+
+    return {
+        "start_location": "Dallas, TX",
+        "end_location": "Los Angeles, CA",
+        "total_distance_miles": 2700.0,
+        "total_stops": len(stops),
+        "vehicle_mpg": 10,
+        "tank_capacity": 50,
+        "initial_fuel": 50,
+        "total_fuel_used": 270.0,
+        "total_fuel_cost": round(cumulative_cost, 2),
+        "fuel_remaining_at_destination": 3.5,
+        "fuel_stops": stops,
+        "route_polyline": polyline.encode(points),
+    }
+
+
+class _Request:
+    def __init__(self, query_params):
+        self.query_params = query_params
+
+
+def measure(plan):
+    from rest_framework.renderers import JSONRenderer
+
+    from route.renderers import MessagePackRenderer, delta_encode_polyline
+
+    json_renderer = JSONRenderer()
+    msgpack_renderer = MessagePackRenderer()
+    plain = {"request": _Request({})}
+    delta = {"request": _Request({"polyline": "delta"})}
+
+    def render_delta_uncached():
+        delta_encode_polyline.cache_clear()
+        return msgpack_renderer.render(plan, renderer_context=delta)
+
+    variants = {
+        "json": lambda: json_renderer.render(plan),
+        "msgpack": lambda: msgpack_renderer.render(plan, renderer_context=plain),
+        "msgpack+delta": lambda: msgpack_renderer.render(plan, renderer_context=delta),
+        # First render of a route, before its transcoded polyline is cached
+        "msgpack+delta*": render_delta_uncached,
+    }
+
+    results = []
+
+    for name, render in variants.items():
+        payload = render()
+        seconds = min(timeit.repeat(render, repeat=REPEAT, number=NUMBER)) / NUMBER
+
+        results.append({
+            "format": name,
+            "bytes": len(payload),
+            "render_ms": round(seconds * 1000, 3),
+        })
+
+    return results
+
+
+def main():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "smart_fuel_routing.settings")
+
+    import django
+
+    django.setup()
+
+    results = measure(synthetic_plan())
+    baseline = results[0]
+
+    print(f"{'format':<15} {'bytes':>9} {'vs json':>8} {'render ms':>10}")
+    for result in results:
+        print(
+            f"{result['format']:<15} {result['bytes']:>9} "
+            f"{result['bytes'] / baseline['bytes']:>7.0%} {result['render_ms']:>10.3f}"
+        )
+
+    print("* polyline transcoding cache cleared before every render")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Station sharding benchmark: memory and latency as the station set grows.
+
+For each station count, fills a throwaway test database with synthetic
+stations over the continental US (half scattered, half clustered around
+metro areas) and, for the coast-to-coast routes of
+``fixtures/long_routes.json``, compares:
+
+* full snapshot: every station loaded per worker (tracemalloc size, build
+  time) and the candidate selection + projection time per route;
+* sharded: the shard map and the tiles the fixture routes touch, with the
+  first (tiles loading) and a repeated request per route.
+
+    python -m route.benchmarks.sharding [station_count ...]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+STATION_COUNTS = (5000, 20000, 80000)
+
+# Continental US
+BOUNDS = (25.0, 49.0, -124.0, -67.0)
+METRO_AREAS = 300
+
+
+def synthetic_stations(count, seed=0):
+    from route.models import FuelStation
+
+    rng = random.Random(seed)
+    min_lat, max_lat, min_lon, max_lon = BOUNDS
+    metros = [
+        (rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon))
+        for _ in range(METRO_AREAS)
+    ]
+
+    stations = []
+    for pk in range(1, count + 1):
+        if pk % 2:
+            lat, lon = rng.choice(metros)
+            lat, lon = lat + rng.gauss(0, 0.3), lon + rng.gauss(0, 0.3)
+        else:
+            lat, lon = rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)
+
+        stations.append(FuelStation(
+            id=pk,
+            opis_id=pk,
+            name=f"TRAVEL CENTER #{pk}",
+            address="",
+            city="Somewhere",
+            state="XX",
+            retail_price=Decimal(f"{rng.uniform(3.0, 4.5):.3f}"),
+            latitude=lat,
+            longitude=lon,
+            is_geocoded=True,
+        ))
+
+    return stations
+
+
+def traced(function):
+    """
+    (result, megabytes still allocated by ``function`` when it returns).
+    """
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    result = function()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, round((after - before) / (1024 * 1024), 1)
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def measure(routes):
+    """
+    Full snapshot vs shard map over the stations currently in the database.
+    """
+    import polyline
+    from django.conf import settings
+
+    from route.services.optimization_service import RouteOptimizationService
+    from route.services.station_shards import StationShardMap
+    from route.services.station_snapshot import StationSnapshot
+
+    route_points = [polyline.decode(route["polyline"]) for route in routes]
+    distance = RouteOptimizationService.MAX_DEVIATION_MILES
+
+    def plan(stations, points):
+        candidates = stations(points).within_bbox(*RouteOptimizationService.get_route_bbox(points))
+        return RouteOptimizationService.project_stations(points, candidates)
+
+    (snapshot, full_mb), (_, build_ms) = traced(StationSnapshot.build), timed(StationSnapshot.build)
+    full_ms = [timed(lambda: plan(lambda _: snapshot, points))[1] for points in route_points]
+
+    def build_shard_map():
+        shard_map = StationShardMap(
+            settings.ROUTE_STATION_TILE_PRECISION, settings.ROUTE_STATION_SHARD_CACHE_SIZE
+        )
+        shard_map.refresh(shard_map.get_tile_versions())
+        return shard_map
+
+    def load_route_tiles(shard_map):
+        for points in route_points:
+            shard_map.corridor_snapshot(points, distance)
+        return shard_map
+
+    # Memory: the map plus every tile the fixture routes touch
+    shard_map, sharded_mb = traced(lambda: load_route_tiles(build_shard_map()))
+
+    shard_map, map_ms = timed(build_shard_map)
+    cold_ms = []
+    warm_ms = []
+    for points in route_points:
+        cold_ms.append(timed(lambda: plan(lambda p: shard_map.corridor_snapshot(p, distance), points))[1])
+        warm_ms.append(timed(lambda: plan(lambda p: shard_map.corridor_snapshot(p, distance), points))[1])
+
+    stats = shard_map.stats()
+
+    return {
+        "stations": len(snapshot),
+        "full_mb": full_mb,
+        "full_build_ms": build_ms,
+        "full_request_ms": full_ms,
+        "tiles": stats["tiles"],
+        "loaded_tiles": stats["loaded_tiles"],
+        "loaded_stations": stats["loaded_stations"],
+        "sharded_mb": sharded_mb,
+        "shard_map_ms": map_ms,
+        "sharded_cold_ms": cold_ms,
+        "sharded_warm_ms": warm_ms,
+    }
+
+
+def main():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "smart_fuel_routing.settings")
+
+    import django
+
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import override_settings
+
+    from route.benchmarks.memory import load_routes
+    from route.models import FuelStation
+
+    counts = [int(arg) for arg in sys.argv[1:]] or STATION_COUNTS
+    routes = load_routes()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+
+    try:
+        with override_settings(ROUTE_PROJECTION_WORKERS=0):
+            print(f"routes: {', '.join(route['name'] for route in routes)}")
+            print(
+                f"{'stations':>9} {'full MB':>8} {'build ms':>9} {'request ms':>20} | "
+                f"{'tiles':>11} {'loaded':>8} {'MB':>6} {'map ms':>7} "
+                f"{'cold ms':>20} {'warm ms':>20}"
+            )
+
+            for count in counts:
+                FuelStation.objects.all().delete()
+                FuelStation.objects.bulk_create(synthetic_stations(count), batch_size=2000)
+
+                report = measure(routes)
+
+                print(
+                    f"{report['stations']:>9} {report['full_mb']:>8.1f} {report['full_build_ms']:>9.0f} "
+                    f"{'/'.join(f'{ms:.0f}' for ms in report['full_request_ms']):>20} | "
+                    f"{report['loaded_tiles']:>5}/{report['tiles']:<5} {report['loaded_stations']:>8} "
+                    f"{report['sharded_mb']:>6.1f} {report['shard_map_ms']:>7.0f} "
+                    f"{'/'.join(f'{ms:.0f}' for ms in report['sharded_cold_ms']):>20} "
+                    f"{'/'.join(f'{ms:.0f}' for ms in report['sharded_warm_ms']):>20}"
+                )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Start-up import-time benchmark.
+
+Runs each scenario in a fresh interpreter under ``python -X importtime``
+and reports the total import time and any heavy modules that were pulled
+in. Exits non-zero when a scenario is over budget.
+
+    python -m route.benchmarks.startup
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+# Modules that only the request path needs; slim start-up must not load them
+HEAVY_MODULES = (
+    "requests",
+    "polyline",
+    "rest_framework.views",
+    "concurrent.futures.process",
+    "multiprocessing.shared_memory",
+)
+
+# Total import time per scenario, in milliseconds. Both measure ~250-300 ms
+# on a developer laptop; pulling the HTTP stack back in adds ~200 ms.
+BUDGET_MS = {
+    "django_setup": 450,
+    "import_fuel_data": 450,
+}
+
+
+def _scenario_args(name, workdir):
+    if name == "django_setup":
+        return ["-c", "import django; django.setup()"]
+
+    if name == "import_fuel_data":
+        # Header-only CSV: exercises the command without touching any rows
+        csv_path = Path(workdir) / "empty.csv"
+        csv_path.write_text(
+            "OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price\n"
+        )
+        return [str(BASE_DIR / "manage.py"), "import_fuel_data", str(csv_path)]
+
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def parse_importtime(output):
+    """
+    Return (total_ms, module_names) from ``-X importtime`` stderr.
+
+    The total is the sum of the cumulative times of top-level imports.
+    """
+    total_us = 0
+    modules = set()
+
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        modules.add(name.strip())
+
+        # Nested imports are indented further than the single leading space
+        if not name.startswith("  "):
+            total_us += int(cumulative)
+
+    return total_us / 1000, modules
+
+
+def measure(name):
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *_scenario_args(name, workdir)],
+            cwd=BASE_DIR,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "smart_fuel_routing.settings"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+    total_ms, modules = parse_importtime(result.stderr)
+
+    return {
+        "scenario": name,
+        "import_ms": round(total_ms, 1),
+        "budget_ms": BUDGET_MS[name],
+        "heavy_modules": sorted(module for module in HEAVY_MODULES if module in modules),
+    }
+
+
+def main():
+    failed = False
+
+    for name in BUDGET_MS:
+        report = measure(name)
+        over_budget = report["import_ms"] > report["budget_ms"]
+        failed = failed or over_budget or bool(report["heavy_modules"])
+
+        print(
+            f"{name:<18} {report['import_ms']:>8.1f} ms "
+            f"(budget {report['budget_ms']} ms){' OVER BUDGET' if over_budget else ''}"
+        )
+        if report["heavy_modules"]:
+            print(f"{'':<18} heavy modules loaded: {', '.join(report['heavy_modules'])}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
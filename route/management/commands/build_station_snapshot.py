@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from route.services.station_snapshot import StationSnapshot
+
+
+class Command(BaseCommand):
+    help = "Write the geocoded station snapshot that workers load at start-up"
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=str(settings.STATION_SNAPSHOT_PATH),
+            help="Snapshot file path (default: STATION_SNAPSHOT_PATH)"
+        )
+
+    def handle(self, *args, **options):
+        snapshot = StationSnapshot.build()
+        snapshot.save(options["output"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Station snapshot written: {len(snapshot)} stations, "
+                f"version {snapshot.version} -> {options['output']}"
+            )
+        )
@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from route.services.retention_service import RetentionService
+
+
+class Command(BaseCommand):
+    help = "Deduplicate stored route polylines into compressed geometries and prune old fuel stops"
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stop-retention-days",
+            type=int,
+            default=settings.ROUTE_FUEL_STOP_RETENTION_DAYS,
+            help="Summarize and delete fuel stops of plans older than this "
+                 f"(default: {settings.ROUTE_FUEL_STOP_RETENTION_DAYS})"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Plans per transaction (default: 500)"
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between fuel-stop batches, to spread the write load"
+        )
+        parser.add_argument(
+            "--skip-polylines",
+            action="store_true",
+            help="Do not compact polylines"
+        )
+        parser.add_argument(
+            "--skip-stops",
+            action="store_true",
+            help="Do not prune fuel stops"
+        )
+
+    def handle(self, *args, **options):
+        if not options["skip_polylines"]:
+            compacted, created = RetentionService.compact_polylines(options["batch_size"])
+            removed = RetentionService.prune_unused_geometries(options["batch_size"])
+            self.stdout.write(
+                f"Polylines: {compacted} requests compacted into {created} new geometries, "
+                f"{removed} unused geometries removed."
+            )
+
+        if not options["skip_stops"]:
+            cutoff = timezone.now() - timedelta(days=options["stop_retention_days"])
+            summarized, deleted = RetentionService.prune_fuel_stops(
+                cutoff, options["batch_size"], options["pause"]
+            )
+            self.stdout.write(
+                f"Fuel stops: {deleted} rows deleted from {summarized} plans older than "
+                f"{options['stop_retention_days']} days."
+            )
+
+        self.stdout.write(self.style.SUCCESS("Route history compaction completed."))
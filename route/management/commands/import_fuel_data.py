@@ -7,6 +7,10 @@ from route.models import FuelStation
 class Command(BaseCommand):
     help = "Import fuel stations from CSV"
 
+    # Data command: skip system checks, which import the URLconf and the
+    # whole HTTP stack (DRF views, requests) this command never uses
+    requires_system_checks = []
+
     def add_arguments(self, parser):
         parser.add_argument('csv_file', type=str)
 
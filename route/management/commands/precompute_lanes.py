@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+
+from route.models import RouteLane
+from route.services.lane_service import LaneService
+
+
+class Command(BaseCommand):
+    help = "Precompute geometry and on-route fuel stations for the most requested lanes"
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=20,
+            help="Number of most requested lanes to precompute (default: 20)"
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Delete precomputed lanes that are no longer in the top list"
+        )
+
+    def handle(self, *args, **options):
+        top_lanes = list(LaneService.get_top_lanes(options["top"]))
+
+        if not top_lanes:
+            self.stdout.write(self.style.WARNING("No route requests with a route_hash found."))
+            return
+
+        self.stdout.write(f"Precomputing {len(top_lanes)} lanes...\n")
+
+        stored = 0
+        failed = 0
+
+        for index, row in enumerate(top_lanes, start=1):
+            label = f"{row['start_location']} → {row['end_location']}"
+
+            try:
+                lane = LaneService.precompute_lane(
+                    route_hash=row["route_hash"],
+                    start_location=row["start_location"],
+                    end_location=row["end_location"],
+                    request_count=row["request_count"],
+                )
+            except Exception as e:
+                failed += 1
+                self.stdout.write(
+                    self.style.ERROR(f"[{index}/{len(top_lanes)}] {label} | {str(e)}")
+                )
+            else:
+                if lane is None:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"[{index}/{len(top_lanes)}] ✖ No stations near route: {label}"
+                        )
+                    )
+                else:
+                    stored += 1
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"[{index}/{len(top_lanes)}] ✔ {label} "
+                            f"({lane.stations.count()} station matches)"
+                        )
+                    )
+
+        if options["prune"]:
+            pruned, _ = RouteLane.objects.exclude(
+                route_hash__in=[row["route_hash"] for row in top_lanes]
+            ).delete()
+            self.stdout.write(f"Pruned {pruned} stale lane rows.")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"\nLane precomputation completed: {stored} stored, {failed} failed.")
+        )
@@ -1,19 +1,22 @@
 import time
-import hashlib
 import requests
 
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from route.models import FuelStation, RouteRequest
+from route.services.rate_limiter import BACKGROUND
+from route.services.resilience import UpstreamUnavailable, get_client
 
 
 class Command(BaseCommand):
     help = "Prepare system data: populate route hashes and geocode fuel stations using Nominatim"
 
+    requires_system_checks = []
+
     NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
-    REQUEST_DELAY = 1  # 1 request per second (respect policy)
     MAX_RETRIES = 3
+    RETRY_BACKOFF = 5  # seconds, multiplied by the attempt number
 
     def handle(self, *args, **kwargs):
 
@@ -40,9 +43,9 @@ class Command(BaseCommand):
         updated = 0
 
         for route in routes:
-            hash_value = hashlib.sha256(
-                f"{route.start_location.strip().lower()}-{route.end_location.strip().lower()}".encode()
-            ).hexdigest()
+            hash_value = RouteRequest.build_route_hash(
+                route.start_location, route.end_location
+            )
 
             route.route_hash = hash_value
             route.save(update_fields=["route_hash"])
@@ -72,89 +75,72 @@ class Command(BaseCommand):
             "User-Agent": "fuel-route-optimizer-app"
         }
 
+        client = get_client("nominatim")
+
         for index, station in enumerate(stations, start=1):
 
             # query = f"{station.address.strip()}, {station.city.strip()}, {station.state.strip()}, USA"
             query = f"{station.city.strip()}, {station.state.strip()}, USA"
 
-            for attempt in range(self.MAX_RETRIES):
-
-                try:
-                    response = requests.get(
-                        self.NOMINATIM_URL,
-                        headers=headers,
-                        params={
-                            "q": query,
-                            "format": "json",
-                            "limit": 1
-                        },
-                        timeout=15
+            try:
+                response = client.get(
+                    self.NOMINATIM_URL,
+                    headers=headers,
+                    params={
+                        "q": query,
+                        "format": "json",
+                        "limit": 1
+                    },
+                    retries=self.MAX_RETRIES - 1,
+                    retry_backoff=self.RETRY_BACKOFF,
+                    priority=BACKGROUND  # interactive lookups go first
+                )
+                response.raise_for_status()
+                data = response.json()
+
+            except (UpstreamUnavailable, requests.exceptions.RequestException) as e:
+                failed_count += 1
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"[{index}/{total}] API Error: {station.name} | {str(e)}"
                     )
+                )
 
-                    if response.status_code == 429:
-                        wait_time = 5 * (attempt + 1)
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f"[{index}/{total}] Rate limit hit. Sleeping {wait_time}s..."
-                            )
+                if client.breaker.state == client.breaker.OPEN:
+                    # Upstream is degraded; back off until the breaker lets a trial through
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"[{index}/{total}] Nominatim degraded. Sleeping {client.breaker.reset_timeout}s..."
                         )
-                        time.sleep(wait_time)
-                        continue
-
-                    response.raise_for_status()
-                    data = response.json()
-
-                    if data:
-                        station.latitude = float(data[0]["lat"])
-                        station.longitude = float(data[0]["lon"])
-                        station.is_geocoded = True
-
-                        station.save(update_fields=[
-                            "latitude",
-                            "longitude",
-                            "is_geocoded"
-                        ])
+                    )
+                    time.sleep(client.breaker.reset_timeout)
 
-                        updated_count += 1
+            else:
+                if data:
+                    station.latitude = float(data[0]["lat"])
+                    station.longitude = float(data[0]["lon"])
+                    station.is_geocoded = True
 
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f"[{index}/{total}] ✔ {station.name}"
-                            )
-                        )
-                    else:
-                        failed_count += 1
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f"[{index}/{total}] ✖ No result: {station.name}"
-                            )
-                        )
+                    station.save(update_fields=[
+                        "latitude",
+                        "longitude",
+                        "is_geocoded"
+                    ])
 
-                    break  # Exit retry loop
+                    updated_count += 1
 
-                except requests.exceptions.Timeout:
-                    if attempt == self.MAX_RETRIES - 1:
-                        failed_count += 1
-                        self.stdout.write(
-                            self.style.ERROR(
-                                f"[{index}/{total}] Timeout: {station.name}"
-                            )
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"[{index}/{total}] ✔ {station.name}"
                         )
-                    else:
-                        time.sleep(2)
-
-                except requests.exceptions.RequestException as e:
-                    if attempt == self.MAX_RETRIES - 1:
-                        failed_count += 1
-                        self.stdout.write(
-                            self.style.ERROR(
-                                f"[{index}/{total}] API Error: {station.name} | {str(e)}"
-                            )
+                    )
+                else:
+                    failed_count += 1
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"[{index}/{total}] ✖ No result: {station.name}"
                         )
-                    else:
-                        time.sleep(2)
-
-            time.sleep(self.REQUEST_DELAY)
+                    )
 
         self.stdout.write("\n")
         self.stdout.write(
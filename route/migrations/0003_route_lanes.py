@@ -0,0 +1,40 @@
+# Generated by Django 5.2.11 on 2026-10-19 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route', '0002_fuelstop_distance_from_route_miles_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteLane',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route_hash', models.CharField(max_length=64, unique=True)),
+                ('start_location', models.CharField(max_length=255)),
+                ('end_location', models.CharField(max_length=255)),
+                ('total_distance_miles', models.FloatField()),
+                ('route_polyline', models.TextField()),
+                ('request_count', models.IntegerField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LaneStation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mile_marker', models.FloatField()),
+                ('deviation_miles', models.FloatField()),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='route.fuelstation')),
+                ('lane', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stations', to='route.routelane')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lane', 'mile_marker'], name='route_lanes_lane_id_25fb9a_idx')],
+            },
+        ),
+    ]
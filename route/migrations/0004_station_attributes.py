@@ -0,0 +1,33 @@
+# Generated by Django 5.2.11 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route', '0003_route_lanes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fuelstation',
+            name='closes_at',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fuelstation',
+            name='opens_at',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fuelstation',
+            name='truck_accessible',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='routelane',
+            name='duration_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
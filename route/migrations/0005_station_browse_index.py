@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-19 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route', '0004_station_attributes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fuelstation',
+            index=models.Index(fields=['is_geocoded', 'state', 'retail_price'], name='route_fuels_is_geoc_017cfa_idx'),
+        ),
+    ]
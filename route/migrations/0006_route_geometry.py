@@ -0,0 +1,43 @@
+# Generated by Django 5.2.11 on 2026-10-19 13:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route', '0005_station_browse_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routerequest',
+            name='fuel_stop_summary',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='routerequest',
+            name='route_polyline',
+            field=models.TextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='RouteGeometry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route_hash', models.CharField(db_index=True, max_length=64)),
+                ('polyline_hash', models.CharField(max_length=64)),
+                ('polyline_compressed', models.BinaryField()),
+                ('polyline_length', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('route_hash', 'polyline_hash'), name='unique_geometry_per_route')],
+            },
+        ),
+        migrations.AddField(
+            model_name='routerequest',
+            name='geometry',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='requests', to='route.routegeometry'),
+        ),
+    ]
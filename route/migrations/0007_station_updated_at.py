@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route', '0006_route_geometry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fuelstation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
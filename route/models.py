@@ -1,3 +1,6 @@
+import hashlib
+import json
+import zlib
 from django.db import models
 from decimal import Decimal
 
@@ -19,18 +22,66 @@ class FuelStation(models.Model):
 
     is_geocoded = models.BooleanField(default=False, db_index=True)
 
+    truck_accessible = models.BooleanField(default=True)
+
+    # Opening hours in the station's local time (its state's time zone).
+    # Both empty, or equal, means open 24 hours; closes_at earlier than
+    # opens_at means open overnight.
+    opens_at = models.TimeField(null=True, blank=True)
+    closes_at = models.TimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every save; part of the station snapshot version
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         indexes = [
             models.Index(fields=["state"]),
             models.Index(fields=["retail_price"]),
             models.Index(fields=["latitude", "longitude"]),
+            # Station browsing: geocoded stations in a state by price
+            models.Index(fields=["is_geocoded", "state", "retail_price"]),
         ]
 
     def __str__(self):
         return f"{self.name} - {self.city}, {self.state}"
     
+class RouteGeometry(models.Model):
+    """
+    A route polyline stored once, zlib-compressed, and shared by every
+    request for the same route with the same geometry.
+    """
+    route_hash = models.CharField(max_length=64, db_index=True)
+    polyline_hash = models.CharField(max_length=64)
+
+    polyline_compressed = models.BinaryField()
+    polyline_length = models.IntegerField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["route_hash", "polyline_hash"],
+                name="unique_geometry_per_route"
+            )
+        ]
+
+    def __str__(self):
+        return f"Geometry {self.route_hash[:12]} ({self.polyline_length} chars)"
+
+    @staticmethod
+    def build_polyline_hash(polyline):
+        return hashlib.sha256(polyline.encode()).hexdigest()
+
+    @staticmethod
+    def compress(polyline):
+        return zlib.compress(polyline.encode(), 9)
+
+    def get_polyline(self):
+        return zlib.decompress(bytes(self.polyline_compressed)).decode()
+
+
 class RouteRequest(models.Model):
     start_location = models.CharField(max_length=255)
     end_location = models.CharField(max_length=255)
@@ -44,7 +95,18 @@ class RouteRequest(models.Model):
     vehicle_mpg = models.FloatField(default=10)
     vehicle_range_miles = models.FloatField(default=500)
 
-    route_polyline = models.TextField()
+    # Emptied once the polyline has been moved to the shared geometry table
+    route_polyline = models.TextField(blank=True)
+    geometry = models.ForeignKey(
+        RouteGeometry,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="requests"
+    )
+
+    # Totals of the fuel stops, kept when old stop rows are pruned
+    fuel_stop_summary = models.JSONField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -56,6 +118,25 @@ class RouteRequest(models.Model):
     def __str__(self):
         return f"{self.start_location} → {self.end_location}"
 
+    def get_route_polyline(self):
+        if self.route_polyline or self.geometry_id is None:
+            return self.route_polyline
+        return self.geometry.get_polyline()
+
+    @staticmethod
+    def build_route_hash(start_location, end_location, waypoints=()):
+        locations = [location.strip().lower() for location in (start_location, *waypoints, end_location)]
+
+        if waypoints:
+            # Unambiguous encoding: "-" also occurs inside place names
+            # ("Winston-Salem, NC")
+            key = json.dumps(locations)
+        else:
+            # Format of every hash stored before waypoints existed
+            key = "-".join(locations)
+
+        return hashlib.sha256(key.encode()).hexdigest()
+
 class FuelStop(models.Model):
     route = models.ForeignKey(
         RouteRequest,
@@ -88,4 +169,49 @@ class FuelStop(models.Model):
 
     def __str__(self):
         return f"Stop {self.stop_order} - {self.station.name}"
-    
\ No newline at end of file
+
+
+class RouteLane(models.Model):
+    """
+    A popular route whose geometry and on-route stations are precomputed.
+    """
+    route_hash = models.CharField(max_length=64, unique=True)
+
+    start_location = models.CharField(max_length=255)
+    end_location = models.CharField(max_length=255)
+
+    total_distance_miles = models.FloatField()
+    duration_seconds = models.FloatField(null=True, blank=True)
+    route_polyline = models.TextField()
+
+    request_count = models.IntegerField(default=0)
+
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Lane {self.start_location} → {self.end_location}"
+
+
+class LaneStation(models.Model):
+    lane = models.ForeignKey(
+        RouteLane,
+        on_delete=models.CASCADE,
+        related_name="stations"
+    )
+
+    station = models.ForeignKey(
+        FuelStation,
+        on_delete=models.CASCADE
+    )
+
+    mile_marker = models.FloatField()
+
+    deviation_miles = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["lane", "mile_marker"]),
+        ]
+
+    def __str__(self):
+        return f"{self.lane_id} @ {self.mile_marker:.1f} mi - station {self.station_id}"
@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination on the primary key: every page is an index
+    range scan, however deep the client has paged, and no COUNT(*) is run.
+    """
+    ordering = "id"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class NewestFirstPagination(KeysetPagination):
+    ordering = "-id"
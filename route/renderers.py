@@ -0,0 +1,94 @@
+"""
+Compact binary rendering of route plans for machine clients.
+
+Clients opt in with ``Accept: application/msgpack`` (or ``?format=msgpack``).
+The document has the same top-level fields as the JSON response, except:
+
+* ``fuel_stops`` is columnar: ``{"fields": [...], "columns": [[...], ...]}``
+  with one column per stop field, so field names are sent once;
+* with ``?polyline=delta``, ``route_polyline`` is replaced by
+  ``route_points``: binary ``[lat0, lon0, dlat1, dlon1, ...]`` at 1e-5
+  degree precision (absolute first point, then deltas), each value a
+  zigzag LEB128 varint as in protobuf.
+"""
+from functools import lru_cache
+
+from rest_framework.renderers import BaseRenderer
+
+
+def columnar_stops(stops):
+    if not stops:
+        return {"fields": [], "columns": []}
+
+    fields = list(stops[0])
+    # Optional fields (e.g. eta) are present on every stop or on none
+    return {
+        "fields": fields,
+        "columns": [[stop.get(field) for stop in stops] for field in fields],
+    }
+
+
+@lru_cache(maxsize=64)
+def delta_encode_polyline(encoded_polyline):
+    """
+    Transcode an encoded polyline to zigzag varints.
+
+    The polyline format already stores zigzag deltas, in 5-bit chunks per
+    character; this only repacks them 7 bits per byte, with no float
+    decoding. Cached because the same route is served many times.
+    """
+    packed = bytearray()
+    value = shift = 0
+
+    for char in encoded_polyline.encode("ascii"):
+        chunk = char - 63
+        value |= (chunk & 0x1F) << shift
+
+        if chunk & 0x20:
+            shift += 5
+            continue
+
+        while value >= 0x80:
+            packed.append((value & 0x7F) | 0x80)
+            value >>= 7
+        packed.append(value)
+        value = shift = 0
+
+    return bytes(packed)
+
+
+def compact_plan(data, delta_polyline=False):
+    """
+    Reshape a plan response for binary clients; other documents (errors,
+    docs) pass through unchanged.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("fuel_stops"), list):
+        return data
+
+    data = {**data, "fuel_stops": columnar_stops(data["fuel_stops"])}
+
+    if delta_polyline and data.get("route_polyline"):
+        data["route_points"] = delta_encode_polyline(data.pop("route_polyline"))
+
+    return data
+
+
+class MessagePackRenderer(BaseRenderer):
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import msgpack
+
+        if data is None:
+            return b""
+
+        request = (renderer_context or {}).get("request")
+        delta_polyline = (
+            request is not None and request.query_params.get("polyline") == "delta"
+        )
+
+        return msgpack.packb(compact_plan(data, delta_polyline), use_bin_type=True)
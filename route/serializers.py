@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from route.models import RouteRequest, FuelStop
+from route.models import FuelStation, RouteRequest, FuelStop
+from route.services.us_states import normalize_state
 
 
 class RouteOptimizationSerializer(serializers.Serializer):
@@ -10,17 +11,38 @@ class RouteOptimizationSerializer(serializers.Serializer):
     tank_capacity = serializers.FloatField(required=False, default=50)
     initial_fuel = serializers.FloatField(required=False)
 
+    # Ordered intermediate pickups/drops between start and end
+    waypoints = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+        default=list,
+        max_length=10
+    )
+
+    departure_time = serializers.DateTimeField(required=False)
+    require_truck_access = serializers.BooleanField(required=False, default=True)
+
+    # Plan for the vehicle profile snapped down to its bucket, shared by
+    # near-identical requests (see RoutePlanningService.quantize_vehicle)
+    allow_approximate = serializers.BooleanField(required=False, default=False)
+
+    # Runner-up stations to list per stop
+    alternatives = serializers.IntegerField(required=False, default=0, min_value=0, max_value=10)
+
     def validate(self, data):
         start = data["start_location"].strip()
         end = data["end_location"].strip()
+        waypoints = [waypoint.strip() for waypoint in data.get("waypoints", [])]
 
-        if start.lower() == end.lower():
+        # Round trips (back to the depot) are fine once there is a stop in between
+        if start.lower() == end.lower() and not waypoints:
             raise serializers.ValidationError(
                 "Start and end locations cannot be the same."
             )
 
         data["start_location"] = start
         data["end_location"] = end
+        data["waypoints"] = waypoints
 
         if "initial_fuel" not in data:
             data["initial_fuel"] = data.get("tank_capacity", 50)
@@ -28,6 +50,27 @@ class RouteOptimizationSerializer(serializers.Serializer):
         return data
 
 
+class ReplanSerializer(RouteOptimizationSerializer):
+    """
+    Same route and vehicle fields as an optimize request, plus where the
+    vehicle is now. departure_time, if given, is the time at current_mile.
+    """
+    current_mile = serializers.FloatField(min_value=0)
+    current_fuel = serializers.FloatField(min_value=0)
+
+    initial_fuel = None
+    allow_approximate = None
+
+    def validate(self, data):
+        data = super().validate(data)
+        data.pop("initial_fuel", None)
+
+        if data["current_fuel"] > data.get("tank_capacity", 50):
+            raise serializers.ValidationError("current_fuel cannot exceed tank_capacity.")
+
+        return data
+
+
 class FuelStopSerializer(serializers.ModelSerializer):
     station_name = serializers.CharField(source="station.name", read_only=True)
     city = serializers.CharField(source="station.city", read_only=True)
@@ -62,6 +105,7 @@ class FuelStopSerializer(serializers.ModelSerializer):
 
 class RouteResponseSerializer(serializers.ModelSerializer):
     fuel_stops = FuelStopSerializer(many=True, read_only=True)
+    route_polyline = serializers.CharField(source="get_route_polyline", read_only=True)
 
     class Meta:
         model = RouteRequest
@@ -75,3 +119,53 @@ class RouteResponseSerializer(serializers.ModelSerializer):
             "route_polyline",
             "fuel_stops",
         ]
+
+
+class FuelStationSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = FuelStation
+        fields = [
+            "id",
+            "opis_id",
+            "name",
+            "address",
+            "city",
+            "state",
+            "retail_price",
+            "latitude",
+            "longitude",
+            "is_geocoded",
+            "truck_accessible",
+            "opens_at",
+            "closes_at",
+        ]
+
+
+class StationFilterSerializer(serializers.Serializer):
+    state = serializers.CharField(required=False)
+    is_geocoded = serializers.BooleanField(required=False, allow_null=True, default=None)
+    min_price = serializers.DecimalField(max_digits=6, decimal_places=3, required=False)
+    max_price = serializers.DecimalField(max_digits=6, decimal_places=3, required=False)
+
+    def validate_state(self, value):
+        state = normalize_state(value)
+
+        if state is None:
+            raise serializers.ValidationError(f"Unknown state: {value}")
+
+        return state
+
+
+class NearestStationQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    radius_miles = serializers.FloatField(required=False, default=25, min_value=0, max_value=250)
+    limit = serializers.IntegerField(required=False, default=10, min_value=1, max_value=100)
+    truck_only = serializers.BooleanField(required=False, default=False)
+
+
+class StoredPlanSerializer(RouteResponseSerializer):
+
+    class Meta(RouteResponseSerializer.Meta):
+        fields = ["id", "created_at", *RouteResponseSerializer.Meta.fields, "fuel_stop_summary"]
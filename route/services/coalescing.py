@@ -0,0 +1,107 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class _Call:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time.
+
+    Concurrent callers with the same key wait for the running computation
+    and share its result (or its exception). With ROUTE_COALESCE_CROSS_PROCESS
+    enabled, processes coordinate through the ROUTE_COALESCE_CACHE backend as
+    well: one process holds a lock entry while it computes and publishes the
+    result for the others to pick up. Point it at a backend shared between
+    processes with an atomic ``add`` (e.g. DatabaseCache); the default
+    local-memory cache only coalesces within one process.
+    """
+
+    LOCK_PREFIX = "singleflight:lock:"
+    RESULT_PREFIX = "singleflight:result:"
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            if getattr(settings, "ROUTE_COALESCE_CROSS_PROCESS", False):
+                call.result = self._do_cross_process(key, fn)
+            else:
+                call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result
+
+    def _do_cross_process(self, key, fn):
+        cache = caches[getattr(settings, "ROUTE_COALESCE_CACHE", "default")]
+        lock_timeout = getattr(settings, "ROUTE_COALESCE_LOCK_TIMEOUT", 30)
+        result_ttl = getattr(settings, "ROUTE_COALESCE_RESULT_TTL", 5)
+
+        lock_key = self.LOCK_PREFIX + key
+        result_key = self.RESULT_PREFIX + key
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + lock_timeout
+
+        while True:
+            if cache.add(lock_key, token, timeout=lock_timeout):
+                try:
+                    result = fn()
+                    cache.set(result_key, result, timeout=result_ttl)
+                    return result
+                finally:
+                    if cache.get(lock_key) == token:
+                        cache.delete(lock_key)
+
+            # Another process is computing; wait for its published result.
+            # If it fails (lock released without a result) or stalls past
+            # the lock timeout, take over.
+            while cache.get(lock_key) is not None and time.monotonic() < deadline:
+                result = cache.get(result_key)
+                if result is not None:
+                    return result
+                time.sleep(self.POLL_INTERVAL)
+
+            result = cache.get(result_key)
+            if result is not None:
+                return result
+
+            if time.monotonic() >= deadline:
+                return fn()
+
+
+route_plans = SingleFlight()
@@ -0,0 +1,107 @@
+import csv
+import json
+
+from django.db.models import Prefetch
+
+from route.models import FuelStop
+
+
+class _Echo:
+    """
+    File-like object whose write() hands the CSV line straight back, so
+    csv.writer can be driven one row at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+class ExportService:
+
+    CHUNK_SIZE = 2000
+
+    STATION_COLUMNS = (
+        "id", "opis_id", "name", "address", "city", "state", "rack_id", "retail_price",
+        "latitude", "longitude", "is_geocoded", "truck_accessible", "opens_at", "closes_at",
+    )
+
+    PLAN_COLUMNS = (
+        "plan_id", "created_at", "start_location", "end_location", "route_hash",
+        "total_distance_miles", "total_fuel_cost", "vehicle_mpg", "vehicle_range_miles",
+        "fuel_stop_summary", "stop_order", "station_id", "station_name", "city", "state", "price_per_gallon",
+        "miles_from_start", "gallons_filled", "cost", "distance_from_route_miles",
+    )
+
+    @staticmethod
+    def stream_csv(header, rows):
+        """
+        Yield CSV lines for ``header`` followed by ``rows``.
+        """
+        writer = csv.writer(_Echo())
+
+        yield writer.writerow(header)
+
+        for row in rows:
+            yield writer.writerow(row)
+
+    @staticmethod
+    def station_rows(queryset):
+        """
+        Station rows in id order, fetched CHUNK_SIZE at a time.
+        """
+        return (
+            queryset
+            .order_by("id")
+            .values_list(*ExportService.STATION_COLUMNS)
+            .iterator(chunk_size=ExportService.CHUNK_SIZE)
+        )
+
+    @staticmethod
+    def plan_rows(queryset):
+        """
+        One row per fuel stop, with the plan's columns repeated; plans
+        without stops (or whose stops were pruned, see fuel_stop_summary)
+        get a single row with empty stop columns.
+
+        Plans are read in chunks, each with one extra query for its stops.
+        """
+        plans = queryset.order_by("id").defer("route_polyline").prefetch_related(
+            Prefetch(
+                "fuel_stops",
+                queryset=FuelStop.objects.select_related("station").order_by("stop_order")
+            )
+        )
+
+        for plan in plans.iterator(chunk_size=ExportService.CHUNK_SIZE // 4):
+            plan_columns = (
+                plan.pk,
+                plan.created_at.isoformat(),
+                plan.start_location,
+                plan.end_location,
+                plan.route_hash,
+                plan.total_distance_miles,
+                plan.total_fuel_cost,
+                plan.vehicle_mpg,
+                plan.vehicle_range_miles,
+                json.dumps(plan.fuel_stop_summary) if plan.fuel_stop_summary is not None else None,
+            )
+
+            stops = plan.fuel_stops.all()
+
+            if not stops:
+                yield plan_columns + (None,) * 10
+                continue
+
+            for stop in stops:
+                yield plan_columns + (
+                    stop.stop_order,
+                    stop.station_id,
+                    stop.station.name,
+                    stop.station.city,
+                    stop.station.state,
+                    stop.station.retail_price,
+                    stop.miles_from_start,
+                    stop.gallons_filled,
+                    stop.cost,
+                    stop.distance_from_route_miles,
+                )
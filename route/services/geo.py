@@ -0,0 +1,239 @@
+"""
+Plain-Python geometry helpers.
+
+Kept free of Django imports so projection worker processes can import
+them without configuring the project.
+"""
+import heapq
+import math
+from bisect import bisect_left, bisect_right
+
+EARTH_RADIUS_MILES = 3959
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) *
+         math.cos(math.radians(lat2)) *
+         math.sin(dlon / 2) ** 2)
+
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+def latitude_band(distance_miles):
+    """
+    Latitude half-width (degrees) that contains every point within
+    ``distance_miles``; great-circle distance is never shorter than the
+    latitude difference.
+    """
+    return distance_miles / (EARTH_RADIUS_MILES * math.pi / 180) + 1e-9
+
+
+def longitude_band(latitude, distance_miles):
+    """
+    Longitude half-width (degrees) that contains every point within
+    ``distance_miles`` of a point at ``latitude``.
+    """
+    band = latitude_band(distance_miles)
+    widest = math.cos(math.radians(min(90.0, abs(latitude) + band)))
+
+    if widest <= band / 180:
+        # Near a pole: every longitude is close
+        return 180.0
+
+    return min(180.0, band / widest)
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_cell_size(precision):
+    """
+    (latitude, longitude) size in degrees of a geohash cell with
+    ``precision`` characters.
+    """
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def geohash_cell(latitude, longitude, precision):
+    """
+    (row, column) of the geohash cell containing the point, counted from
+    the south-west corner of the world.
+    """
+    bits = 5 * precision
+    lat_size, lon_size = geohash_cell_size(precision)
+
+    row = min(int(math.floor((latitude + 90) / lat_size)), 2 ** (bits // 2) - 1)
+    column = min(int(math.floor((longitude + 180) / lon_size)), 2 ** ((bits + 1) // 2) - 1)
+
+    return row, column
+
+
+def geohash_from_cell(row, column, precision):
+    """
+    Geohash string of a cell; bits alternate starting with longitude.
+    """
+    bits = 5 * precision
+    lat_bits, lon_bits = bits // 2, (bits + 1) // 2
+    value = 0
+
+    for position in range(bits):
+        if position % 2 == 0:
+            lon_bits -= 1
+            value = (value << 1) | ((column >> lon_bits) & 1)
+        else:
+            lat_bits -= 1
+            value = (value << 1) | ((row >> lat_bits) & 1)
+
+    return "".join(
+        GEOHASH_ALPHABET[(value >> shift) & 0x1F]
+        for shift in range(bits - 5, -1, -5)
+    )
+
+
+def geohash_to_cell(geohash):
+    """
+    Inverse of geohash_from_cell: (row, column) of a geohash.
+    """
+    bits = 5 * len(geohash)
+    value = 0
+    for char in geohash:
+        value = (value << 5) | GEOHASH_ALPHABET.index(char)
+
+    row = column = 0
+    for position in range(bits):
+        bit = (value >> (bits - 1 - position)) & 1
+        if position % 2 == 0:
+            column = (column << 1) | bit
+        else:
+            row = (row << 1) | bit
+
+    return row, column
+
+
+def geohash_bounds(geohash):
+    """
+    (min_lat, max_lat, min_lon, max_lon) of a geohash cell.
+    """
+    row, column = geohash_to_cell(geohash)
+    lat_size, lon_size = geohash_cell_size(len(geohash))
+
+    return (
+        row * lat_size - 90,
+        (row + 1) * lat_size - 90,
+        column * lon_size - 180,
+        (column + 1) * lon_size - 180,
+    )
+
+
+def corridor_geohashes(points, distance_miles, precision):
+    """
+    Geohashes of every cell with a point within ``distance_miles`` of the
+    route ``points``.
+    """
+    band = latitude_band(distance_miles)
+    columns = 2 ** ((5 * precision + 1) // 2)
+    cells = set()
+    previous = None
+
+    for lat, lon in points:
+        lon_band = longitude_band(lat, distance_miles)
+
+        bottom = geohash_cell(max(-90.0, lat - band), lon, precision)[0]
+        top = geohash_cell(min(90.0, lat + band), lon, precision)[0]
+
+        if lon - lon_band < -180 or lon + lon_band > 180:
+            # Band wraps around the antimeridian: take every column
+            left, right = 0, columns - 1
+        else:
+            left = geohash_cell(lat, lon - lon_band, precision)[1]
+            right = geohash_cell(lat, lon + lon_band, precision)[1]
+
+        # Consecutive route points usually cover the same cells
+        if (bottom, top, left, right) == previous:
+            continue
+        previous = (bottom, top, left, right)
+
+        for row in range(bottom, top + 1):
+            for column in range(left, right + 1):
+                cells.add((row, column))
+
+    return {geohash_from_cell(row, column, precision) for row, column in cells}
+
+
+def project_points(points, mile_markers, station_lats, station_lons, max_distance, bbox=None,
+                   station_ranks=None, station_groups=None, per_point_limit=None):
+    """
+    Match route points against latitude-sorted station coordinates.
+
+    Returns (mile_marker, distance, station_index) for every point/station
+    pair within ``max_distance`` miles, in route order. ``bbox`` optionally
+    restricts matches to (min_lat, max_lat, min_lon, max_lon).
+
+    With ``per_point_limit``, only that many stations with the lowest
+    ``station_ranks`` are kept per point and per ``station_groups`` value,
+    so the result stays proportional to the route length however dense
+    the stations are.
+    """
+    band = latitude_band(max_distance)
+    matches = []
+    point_matches = {}
+
+    # Plain lists: indexing a float array allocates a new float every time
+    station_lats = list(station_lats)
+    station_lons = list(station_lons)
+
+    for (lat, lon), mile_marker in zip(points, mile_markers):
+        lo = bisect_left(station_lats, lat - band)
+        hi = bisect_right(station_lats, lat + band)
+
+        lon_band = longitude_band(lat, max_distance)
+        min_lon, max_lon = lon - lon_band, lon + lon_band
+        # Longitude pre-check only where the band does not wrap around
+        check_lon = min_lon >= -180 and max_lon <= 180
+
+        if per_point_limit:
+            point_matches.clear()
+
+        for index in range(lo, hi):
+            station_lat = station_lats[index]
+            station_lon = station_lons[index]
+
+            # Cheap rejection before the haversine: on east-west routes the
+            # latitude band spans the whole country
+            if check_lon and not min_lon <= station_lon <= max_lon:
+                continue
+
+            if bbox is not None and not (
+                bbox[0] <= station_lat <= bbox[1] and bbox[2] <= station_lon <= bbox[3]
+            ):
+                continue
+
+            distance = haversine(lat, lon, station_lat, station_lon)
+
+            if distance <= max_distance:
+                if per_point_limit:
+                    point_matches.setdefault(station_groups[index], []).append(
+                        (station_ranks[index], index, distance)
+                    )
+                else:
+                    matches.append((mile_marker, distance, index))
+
+        if per_point_limit and point_matches:
+            kept = []
+            for group_matches in point_matches.values():
+                if len(group_matches) > per_point_limit:
+                    group_matches = heapq.nsmallest(per_point_limit, group_matches)
+                kept.extend(group_matches)
+
+            # Same order as the unbounded result
+            kept.sort(key=lambda match: match[1])
+
+            for _, index, distance in kept:
+                matches.append((mile_marker, distance, index))
+
+    return matches
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+
+from route.models import LaneStation, RouteLane, RouteRequest
+from route.services.ors_service import ORSService
+from route.services.optimization_service import RouteOptimizationService
+from route.services.rate_limiter import BACKGROUND
+from route.services.station_shards import get_corridor_stations, sharding_enabled
+
+
+class LaneService:
+
+    @staticmethod
+    def get_top_lanes(limit):
+        """
+        Most requested route hashes, busiest first.
+        """
+        return (
+            RouteRequest.objects
+            .filter(route_hash__isnull=False)
+            .values("route_hash")
+            .annotate(
+                request_count=Count("id"),
+                start_location=Min("start_location"),
+                end_location=Min("end_location"),
+            )
+            .order_by("-request_count", "route_hash")[:limit]
+        )
+
+    @staticmethod
+    def precompute_lane(route_hash, start_location, end_location, request_count=0):
+        """
+        Fetch the lane geometry once and store its on-route stations.
+
+        Returns the lane, or None when no geocoded station lies near the
+        route (such routes keep going through the regular planner).
+        """
+        route_data = ORSService.get_route(start_location, end_location, priority=BACKGROUND)
+        route_points = route_data["decoded_points"]
+
+        candidate_stations = RouteOptimizationService.get_candidate_stations(route_points)
+
+        with transaction.atomic():
+            if not candidate_stations:
+                RouteLane.objects.filter(route_hash=route_hash).delete()
+                return None
+
+            # Every on-route station: which ones are cheapest depends on the
+            # prices at load time
+            projected = RouteOptimizationService.project_stations(
+                route_points, candidate_stations, bounded=False
+            )
+
+            lane, _ = RouteLane.objects.update_or_create(
+                route_hash=route_hash,
+                defaults={
+                    "start_location": start_location,
+                    "end_location": end_location,
+                    "total_distance_miles": route_data["distance_miles"],
+                    "duration_seconds": route_data.get("duration_seconds"),
+                    "route_polyline": route_data["polyline"],
+                    "request_count": request_count,
+                }
+            )
+
+            lane.stations.all().delete()
+            LaneStation.objects.bulk_create(
+                [
+                    LaneStation(
+                        lane=lane,
+                        station_id=station.pk,
+                        mile_marker=mile_marker,
+                        deviation_miles=deviation,
+                    )
+                    for mile_marker, deviation, station in projected
+                ],
+                batch_size=1000
+            )
+
+        return lane
+
+    @staticmethod
+    def load_lane(route_hash):
+        """
+        Return (lane, projected_stations) for a precomputed lane, or None.
+
+        Only station ids are stored on the lane, so current prices are
+        joined in from the station snapshot on every load.
+        """
+        lane = RouteLane.objects.filter(route_hash=route_hash).first()
+
+        if lane is None:
+            return None
+
+        rows = list(
+            lane.stations
+            .order_by("mile_marker", "station_id")
+            .values_list("mile_marker", "deviation_miles", "station_id")
+        )
+
+        if sharding_enabled():
+            # Imported here: only sharded workers decode lane geometry
+            import polyline
+
+            route_points = polyline.decode(lane.route_polyline)
+        else:
+            route_points = ()
+
+        stations = get_corridor_stations(
+            route_points, RouteOptimizationService.MAX_DEVIATION_MILES
+        ).by_id
+
+        projected = RouteOptimizationService.limit_per_point(
+            [
+                (mile_marker, deviation, stations[station_id])
+                for mile_marker, deviation, station_id in rows
+                if station_id in stations
+            ],
+            getattr(settings, "ROUTE_CANDIDATES_PER_POINT", None)
+        )
+
+        return lane, projected
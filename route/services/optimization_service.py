@@ -1,25 +1,29 @@
-import math
+import heapq
+from bisect import bisect_right
+from itertools import groupby
+from operator import itemgetter
+from datetime import timedelta
 from decimal import Decimal
-from route.models import FuelStation
+
+from django.conf import settings
+from django.utils import timezone
+
+from route.services import geo
+from route.services.station_shards import get_corridor_stations, sharding_enabled
+from route.services.station_snapshot import ATTR_ALWAYS_OPEN, StationSnapshot
+from route.services.us_states import get_state_time_zone
 
 
 class RouteOptimizationService:
 
+    MAX_DEVIATION_MILES = 20
+
     @staticmethod
     def haversine(lat1, lon1, lat2, lon2):
-        R = 3959  # miles
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-
-        a = (math.sin(dlat / 2) ** 2 +
-             math.cos(math.radians(lat1)) *
-             math.cos(math.radians(lat2)) *
-             math.sin(dlon / 2) ** 2)
-
-        return 2 * R * math.asin(math.sqrt(a))
+        return geo.haversine(lat1, lon1, lat2, lon2)
 
     @staticmethod
-    def get_candidate_stations(route_points):
+    def get_route_bbox(route_points):
 
         lats = [pt[0] for pt in route_points]
         lons = [pt[1] for pt in route_points]
@@ -27,48 +31,302 @@ class RouteOptimizationService:
         min_lat, max_lat = min(lats), max(lats)
         min_lon, max_lon = min(lons), max(lons)
 
-        return FuelStation.objects.filter(
-            is_geocoded=True,
-            latitude__gte=min_lat - 1,
-            latitude__lte=max_lat + 1,
-            longitude__gte=min_lon - 1,
-            longitude__lte=max_lon + 1
+        return (min_lat - 1, max_lat + 1, min_lon - 1, max_lon + 1)
+
+    @staticmethod
+    def get_candidate_stations(route_points):
+        return get_corridor_stations(
+            route_points, RouteOptimizationService.MAX_DEVIATION_MILES
+        ).within_bbox(
+            *RouteOptimizationService.get_route_bbox(route_points)
         )
 
+    @staticmethod
+    def get_cumulative_distances(route_points):
+        cumulative_distances = [0.0]
+        total_route_distance = 0.0
+
+        for i in range(len(route_points) - 1):
+            lat1, lon1 = route_points[i]
+            lat2, lon2 = route_points[i + 1]
+
+            segment = RouteOptimizationService.haversine(lat1, lon1, lat2, lon2)
+            total_route_distance += segment
+            cumulative_distances.append(total_route_distance)
+
+        return cumulative_distances
+
+    @staticmethod
+    def project_stations(route_points, candidate_stations, bounded=True):
+        """
+        Match every route point against the candidate stations within
+        MAX_DEVIATION_MILES of it.
+
+        Returns (mile_marker, deviation, station) tuples ordered by mile marker.
+        Routes with at least ROUTE_PROJECTION_PARALLEL_THRESHOLD points are
+        split across ROUTE_PROJECTION_WORKERS processes when configured
+        (workers share the full snapshot, so not with station sharding).
+
+        Only the ROUTE_CANDIDATES_PER_POINT cheapest stations of each
+        projection group (attribute mask and opening hours, see
+        get_projection_group) are kept per route point, which bounds memory
+        on long routes. Stop selection is unaffected, with or without
+        required attributes or a departure time: every station at a point
+        is reached at the same time, so the cheapest eligible entry of a
+        mile window is always among the cheapest entries of its group at
+        one of its points. Projections stored for later re-pricing (lanes)
+        pass ``bounded=False``.
+        """
+        cumulative_distances = RouteOptimizationService.get_cumulative_distances(route_points)
+
+        workers = getattr(settings, "ROUTE_PROJECTION_WORKERS", 0)
+        threshold = getattr(settings, "ROUTE_PROJECTION_PARALLEL_THRESHOLD", 20000)
+        per_point_limit = getattr(settings, "ROUTE_CANDIDATES_PER_POINT", None) if bounded else None
+
+        matches = None
+
+        if workers > 1 and len(route_points) >= threshold and not sharding_enabled():
+            # Imported here: only long routes need multiprocessing
+            from concurrent.futures.process import BrokenProcessPool
+            from route.services.parallel_projection import (
+                retire_projection_pool,
+                use_projection_pool,
+            )
+
+            # Workers search the shared full snapshot, limited to the route bbox
+            snapshot = StationSnapshot.current()
+            with use_projection_pool(snapshot, workers) as pool:
+                try:
+                    matches = pool.project(
+                        route_points,
+                        cumulative_distances,
+                        RouteOptimizationService.MAX_DEVIATION_MILES,
+                        bbox=RouteOptimizationService.get_route_bbox(route_points),
+                        per_point_limit=per_point_limit
+                    )
+                except BrokenProcessPool:
+                    # A worker died; drop the pool and finish in-process
+                    retire_projection_pool(pool)
+                except RuntimeError:
+                    # Pool shut down under us (e.g. at exit); finish in-process
+                    pass
+
+        if matches is None:
+            snapshot = candidate_stations
+            matches = geo.project_points(
+                route_points,
+                cumulative_distances,
+                candidate_stations.latitudes,
+                candidate_stations.longitudes,
+                RouteOptimizationService.MAX_DEVIATION_MILES,
+                station_ranks=candidate_stations.price_ranks,
+                station_groups=candidate_stations.projection_groups,
+                per_point_limit=per_point_limit
+            )
+
+        # Swap indexes for stations in place, so the index tuples are freed
+        # as we go instead of both lists being alive at once
+        stations = snapshot.stations
+        for position, (mile_marker, distance, index) in enumerate(matches):
+            matches[position] = (mile_marker, distance, stations[index])
+
+        return matches
+
+    @staticmethod
+    def limit_per_point(projected, per_point_limit):
+        """
+        Apply the project_stations bound to an unbounded projection (e.g.
+        a lane joined with current prices): the ``per_point_limit``
+        cheapest stations of each projection group at every mile marker.
+        """
+        if not per_point_limit:
+            return projected
+
+        limited = []
+
+        for _, entries in groupby(projected, key=itemgetter(0)):
+            groups = {}
+            for entry in entries:
+                groups.setdefault(entry[2].projection_group, []).append(entry)
+
+            for group in groups.values():
+                if len(group) > per_point_limit:
+                    group = heapq.nsmallest(per_point_limit, group, key=lambda entry: entry[2].price_rank)
+                limited.extend(group)
+
+        return limited
+
+    @staticmethod
+    def get_projected_stations(route_points):
+        """
+        Stations projected onto the route, or None when no station lies
+        anywhere near it.
+        """
+        candidate_stations = RouteOptimizationService.get_candidate_stations(route_points)
+
+        if not candidate_stations:
+            return None
+
+        return RouteOptimizationService.project_stations(route_points, candidate_stations)
+
+    @staticmethod
+    def build_eta(legs, departure_time, start_mile=0.0):
+        """
+        Return a function mapping a mile marker to the estimated arrival
+        time, interpolating linearly within each OSRM leg (i.e. at that
+        leg's average speed). ``departure_time`` is when the vehicle is at
+        ``start_mile``.
+
+        Returns None without a departure time or leg durations.
+        """
+        if departure_time is None or not legs:
+            return None
+
+        miles = [0.0]
+        seconds = [0.0]
+
+        for leg in legs:
+            if leg.get("duration_seconds") is None:
+                return None
+            miles.append(miles[-1] + leg["distance_miles"])
+            seconds.append(seconds[-1] + leg["duration_seconds"])
+
+        def seconds_at(mile_marker):
+            i = min(max(bisect_right(miles, mile_marker), 1), len(miles) - 1)
+            span = miles[i] - miles[i - 1]
+            fraction = (mile_marker - miles[i - 1]) / span if span > 0 else 0.0
+
+            return seconds[i - 1] + fraction * (seconds[i] - seconds[i - 1])
+
+        offset = seconds_at(start_mile) if start_mile else 0.0
+
+        def eta_at(mile_marker):
+            return departure_time + timedelta(seconds=seconds_at(mile_marker) - offset)
+
+        return eta_at
+
+    @staticmethod
+    def is_open_at(station, when):
+        """
+        Whether the station is open at ``when``. Hours are local to the
+        station, in its state's time zone (the server's TIME_ZONE for
+        unknown states); naive times are taken as server time. Stations
+        without hours, or with equal opening and closing times, are always
+        open.
+        """
+        if station.attribute_mask & ATTR_ALWAYS_OPEN:
+            return True
+
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+
+        local_time = timezone.localtime(
+            when, get_state_time_zone(station.state) or timezone.get_default_timezone()
+        ).time()
+
+        if station.opens_at < station.closes_at:
+            return station.opens_at <= local_time < station.closes_at
+
+        # Open overnight, e.g. 18:00 - 06:00
+        return local_time >= station.opens_at or local_time < station.closes_at
+
+    @staticmethod
+    def station_rank(entry):
+        """
+        Sort key for (mile_marker, deviation, station) entries: cheapest
+        first, then the furthest along the route.
+        """
+        return entry[2].retail_price, -entry[0], entry[2].pk
+
+    @staticmethod
+    def rank_alternatives(reachable, chosen, gallons, limit):
+        """
+        The ``limit`` next-best stations from the window the stop was chosen
+        from. ``cost_delta`` is the extra cost of buying the same
+        ``gallons`` there instead.
+        """
+        best = {}
+
+        # A station matches many route points; keep its best entry
+        for entry in reachable:
+            pk = entry[2].pk
+            if pk == chosen.pk:
+                continue
+            if pk not in best or RouteOptimizationService.station_rank(entry) < \
+                    RouteOptimizationService.station_rank(best[pk]):
+                best[pk] = entry
+
+        return [
+            {
+                "station_name": station.name,
+                "city": station.city,
+                "state": station.state,
+                "latitude": station.latitude,
+                "longitude": station.longitude,
+                "price_per_gallon": float(station.retail_price),
+                "miles_from_start": float(round(mile, 2)),
+                "distance_from_route_miles": float(round(deviation, 2)),
+                "price_delta_per_gallon": float(station.retail_price - chosen.retail_price),
+                "cost_delta": float(round((station.retail_price - chosen.retail_price) * gallons, 2)),
+            }
+            for mile, deviation, station in heapq.nsmallest(
+                limit, best.values(), key=RouteOptimizationService.station_rank
+            )
+        ]
+
     @staticmethod
     def calculate_realistic_stops(
         total_distance,
         mpg,
         tank_capacity,
         initial_fuel,
-        route_points
+        route_points=None,
+        projected_stations=None,
+        required_attributes=0,
+        eta_at=None,
+        start_mile=0.0,
+        alternatives=0
     ):
+        """
+        Plan refuelling stops along the route.
+
+        ``projected_stations`` may be passed in (e.g. from a precomputed lane)
+        to skip the geometry work; otherwise it is computed from
+        ``route_points``.
+
+        Only stations whose ``attribute_mask`` has every bit of
+        ``required_attributes`` set are considered. With ``eta_at`` (see
+        build_eta) stations closed at the estimated arrival time are skipped
+        and each stop carries its ETA.
+
+        Planning starts at ``start_mile`` with ``initial_fuel`` in the tank
+        (replanning mid-trip); mile markers stay relative to the route
+        start. With ``alternatives`` each stop lists that many runner-up
+        stations (see rank_alternatives).
+        """
         stops = []
         total_cost = Decimal("0.00")
         total_fuel_used = Decimal("0.00")
 
-        current_position = 0.0
+        current_position = float(start_mile)
         current_fuel = Decimal(str(initial_fuel))
         stop_order = 1
 
         max_range = Decimal(str(mpg)) * Decimal(str(tank_capacity))
 
-        candidate_stations = RouteOptimizationService.get_candidate_stations(route_points)
+        if projected_stations is None:
+            projected_stations = RouteOptimizationService.get_projected_stations(route_points)
 
-        if not candidate_stations.exists():
-            return [], Decimal("0.00"), Decimal("0.00"), current_fuel
+            if projected_stations is None:
+                return [], Decimal("0.00"), Decimal("0.00"), current_fuel
 
-        # Precompute cumulative route distances
-        cumulative_distances = [0.0]
-        total_route_distance = 0.0
-
-        for i in range(len(route_points) - 1):
-            lat1, lon1 = route_points[i]
-            lat2, lon2 = route_points[i + 1]
+        if required_attributes:
+            projected_stations = [
+                entry for entry in projected_stations
+                if entry[2].attribute_mask & required_attributes == required_attributes
+            ]
 
-            segment = RouteOptimizationService.haversine(lat1, lon1, lat2, lon2)
-            total_route_distance += segment
-            cumulative_distances.append(total_route_distance)
+        mile_markers = [entry[0] for entry in projected_stations]
 
         while current_position < total_distance:
 
@@ -84,30 +342,30 @@ class RouteOptimizationService:
             reachable_limit = float(current_position + float(reachable_miles))
 
             # Find reachable stations
-            reachable_stations = []
+            lo = bisect_right(mile_markers, current_position)
+            hi = bisect_right(mile_markers, reachable_limit)
 
-            for idx, mile_marker in enumerate(cumulative_distances):
-                if current_position < mile_marker <= reachable_limit:
-                    lat, lon = route_points[idx]
+            if lo >= hi:
+                raise Exception("Route infeasible: no fuel station within reachable range.")
 
-                    for station in candidate_stations:
-                        distance = RouteOptimizationService.haversine(
-                            lat, lon,
-                            station.latitude,
-                            station.longitude
-                        )
+            reachable = projected_stations[lo:hi]
 
-                        if distance <= 20:  # 20 mile deviation
-                            reachable_stations.append(
-                                (station, mile_marker, distance)
-                            )
+            if eta_at is not None:
+                reachable = [
+                    entry for entry in reachable
+                    if RouteOptimizationService.is_open_at(entry[2], eta_at(entry[0]))
+                ]
 
-            if not reachable_stations:
-                raise Exception("Route infeasible: no fuel station within reachable range.")
+                if not reachable:
+                    raise Exception(
+                        "Route infeasible: no fuel station open on arrival within reachable range."
+                    )
 
-            # Choose cheapest station
-            reachable_stations.sort(key=lambda x: (x[0].retail_price, -x[1]))
-            station, station_mile, deviation = reachable_stations[0]
+            # Choose cheapest station, preferring the furthest one on ties
+            station_mile, deviation, station = min(
+                reachable,
+                key=RouteOptimizationService.station_rank
+            )
 
             distance_to_station = Decimal(str(station_mile - current_position))
             fuel_used = distance_to_station / Decimal(str(mpg))
@@ -132,7 +390,7 @@ class RouteOptimizationService:
             current_fuel += refill_amount
             total_cost += refill_cost
 
-            stops.append({
+            stop = {
                 "stop_order": stop_order,
                 "station_name": station.name,
                 "city": station.city,
@@ -154,7 +412,17 @@ class RouteOptimizationService:
                 "cumulative_cost": float(round(total_cost, 2)),
 
                 "distance_from_route_miles": float(round(deviation, 2))
-            })
+            }
+
+            if eta_at is not None:
+                stop["eta"] = eta_at(station_mile).isoformat()
+
+            if alternatives:
+                stop["alternatives"] = RouteOptimizationService.rank_alternatives(
+                    reachable, station, refill_amount, alternatives
+                )
+
+            stops.append(stop)
 
             stop_order += 1
 
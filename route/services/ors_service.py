@@ -1,24 +1,88 @@
-import requests
-import polyline
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Avg
+
+from route.models import FuelStation, RouteRequest
+from route.services.rate_limiter import INTERACTIVE
+from route.services.resilience import UpstreamUnavailable, get_client
+from route.services.us_states import normalize_state
 
 
 class ORSService:
 
+    NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
     OSRM_ROUTE_URL = "https://router.project-osrm.org/route/v1/driving"
 
+    METERS_TO_MILES = 0.000621371
+
+    GEOCODE_CACHE_TTL = 30 * 24 * 3600
+    ROUTE_CACHE_TTL = 24 * 3600
+    ROUTE_STALE_TTL = 7 * 24 * 3600
+
     @staticmethod
-    def geocode_location(location):
-
-        response = requests.get(
-            "https://nominatim.openstreetmap.org/search",
-            headers={"User-Agent": "fuel-route-optimizer"},
-            params={
-                "q": location,
-                "format": "json",
-                "limit": 1
-            },
-            timeout=15
-        )
+    def decode_polyline(encoded_polyline):
+        import polyline
+
+        return polyline.decode(encoded_polyline)
+
+    @staticmethod
+    def _geocode_cache_key(location):
+        return "geocode:" + hashlib.sha1(location.strip().lower().encode()).hexdigest()
+
+    @staticmethod
+    def offline_geocode(location):
+        """
+        Approximate "City, State" from the geocoded fuel stations in that
+        city. Used only when Nominatim is unavailable.
+        """
+        parts = [part.strip() for part in location.split(",")]
+
+        if len(parts) < 2:
+            return None
+
+        state = normalize_state(parts[1])
+        if state is None:
+            return None
+
+        centre = FuelStation.objects.filter(
+            is_geocoded=True,
+            city__iexact=parts[0],
+            state=state
+        ).aggregate(lat=Avg("latitude"), lon=Avg("longitude"))
+
+        if centre["lat"] is None:
+            return None
+
+        return centre["lat"], centre["lon"]
+
+    @staticmethod
+    def geocode_location(location, priority=INTERACTIVE):
+
+        cache_key = ORSService._geocode_cache_key(location)
+        cached = cache.get(cache_key)
+
+        if cached is not None:
+            return cached
+
+        try:
+            response = get_client("nominatim").get(
+                ORSService.NOMINATIM_URL,
+                headers={"User-Agent": "fuel-route-optimizer"},
+                params={
+                    "q": location,
+                    "format": "json",
+                    "limit": 1
+                },
+                priority=priority
+            )
+        except UpstreamUnavailable:
+            fallback = ORSService.offline_geocode(location)
+            if fallback is None:
+                raise
+            return fallback
 
         response.raise_for_status()
         data = response.json()
@@ -29,21 +93,100 @@ class ORSService:
         lat = float(data[0]["lat"])
         lon = float(data[0]["lon"])
 
+        cache.set(cache_key, (lat, lon), ORSService.GEOCODE_CACHE_TTL)
+
         return lat, lon
 
     @staticmethod
-    def get_route(start_location, end_location):
+    def _geocode_in_thread(location, priority):
+        """
+        geocode_location for a short-lived worker thread, closing the
+        database connections it opened (offline fallback, database cache).
+        """
+        try:
+            return ORSService.geocode_location(location, priority)
+        finally:
+            connections.close_all()
 
-        start_lat, start_lon = ORSService.geocode_location(start_location)
-        end_lat, end_lon = ORSService.geocode_location(end_location)
+    @staticmethod
+    def geocode_locations(locations, priority=INTERACTIVE):
+        """
+        Geocode several locations, concurrently for those not cached yet.
+        Returns coordinates in the order given.
+        """
+        unique = list(dict.fromkeys(locations))
+        cached = cache.get_many([ORSService._geocode_cache_key(location) for location in unique])
+
+        coordinates = {}
+        missing = []
+
+        for location in unique:
+            hit = cached.get(ORSService._geocode_cache_key(location))
+            if hit is not None:
+                coordinates[location] = hit
+            else:
+                missing.append(location)
+
+        if len(missing) == 1:
+            coordinates[missing[0]] = ORSService.geocode_location(missing[0], priority)
+        elif missing:
+            from concurrent.futures import ThreadPoolExecutor
+
+            # Nominatim is still paced by the shared rate limiter; this only
+            # overlaps the waiting and the round trips
+            with ThreadPoolExecutor(max_workers=min(8, len(missing))) as executor:
+                results = executor.map(
+                    lambda location: ORSService._geocode_in_thread(location, priority),
+                    missing
+                )
+                coordinates.update(zip(missing, results))
+
+        return [coordinates[location] for location in locations]
 
-        url = (
-            f"{ORSService.OSRM_ROUTE_URL}/"
-            f"{start_lon},{start_lat};{end_lon},{end_lat}"
-            "?overview=full&geometries=polyline"
+    @staticmethod
+    def _from_route_cache(cached):
+        route_data = {key: value for key, value in cached.items() if key != "cached_at"}
+        return {**route_data, "decoded_points": ORSService.decode_polyline(route_data["polyline"])}
+
+    @staticmethod
+    def get_route(start_location, end_location, priority=INTERACTIVE, waypoints=()):
+        """
+        Driving route from start to end through the ordered ``waypoints``,
+        fetched with a single OSRM call. ``legs`` holds one entry per
+        consecutive pair of locations.
+
+        Routes are cached for ROUTE_CACHE_TTL in the shared cache, which is
+        read before calling OSRM; an expired route is still served while
+        OSRM is unavailable.
+        """
+        route_cache_key = "route:" + RouteRequest.build_route_hash(
+            start_location, end_location, waypoints
         )
 
-        response = requests.get(url, timeout=20)
+        cached = cache.get(route_cache_key)
+        if cached is not None and cached.get("cached_at", 0) > time.time() - ORSService.ROUTE_CACHE_TTL:
+            return ORSService._from_route_cache(cached)
+
+        try:
+            coordinates = ORSService.geocode_locations(
+                [start_location, *waypoints, end_location], priority
+            )
+
+            url = f"{ORSService.OSRM_ROUTE_URL}/" + ";".join(
+                f"{lon},{lat}" for lat, lon in coordinates
+            )
+
+            response = get_client("osrm").get(
+                url,
+                params={"overview": "full", "geometries": "polyline"},
+                priority=priority
+            )
+        except UpstreamUnavailable:
+            # Serve the last good route for this lane if we have one
+            if cached is None:
+                raise
+            return ORSService._from_route_cache(cached)
+
         response.raise_for_status()
         data = response.json()
 
@@ -55,11 +198,22 @@ class ORSService:
         distance_meters = route["distance"]
         encoded_polyline = route["geometry"]
 
-        decoded_points = polyline.decode(encoded_polyline)
-
-        return {
-            "distance_miles": distance_meters * 0.000621371,
-            "polyline": encoded_polyline,
-            "decoded_points": decoded_points
+        decoded_points = ORSService.decode_polyline(encoded_polyline)
+
+        route_data = {
+            "distance_miles": distance_meters * ORSService.METERS_TO_MILES,
+            "duration_seconds": route.get("duration"),
+            "legs": [
+                {
+                    "distance_miles": leg["distance"] * ORSService.METERS_TO_MILES,
+                    "duration_seconds": leg["duration"]
+                }
+                for leg in route.get("legs", [])
+            ],
+            "polyline": encoded_polyline
         }
-        
\ No newline at end of file
+
+        # Kept past the TTL as a fallback for when OSRM is down
+        cache.set(route_cache_key, {**route_data, "cached_at": time.time()}, ORSService.ROUTE_STALE_TTL)
+
+        return {**route_data, "decoded_points": decoded_points}
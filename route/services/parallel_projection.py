@@ -0,0 +1,228 @@
+"""
+Process-pool station projection for very long routes.
+
+Station coordinates, price ranks and attribute masks are copied once per
+snapshot version into a shared memory block that every worker attaches to
+at start-up, so tasks only carry their slice of the route.
+"""
+import atexit
+import math
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+
+from route.services.geo import project_points
+
+# Per-worker views onto the shared station arrays
+_worker_shm = None
+_worker_lats = None
+_worker_lons = None
+_worker_ranks = None
+_worker_groups = None
+
+
+def _init_worker(shm_name, station_count):
+    global _worker_shm, _worker_lats, _worker_lons, _worker_ranks, _worker_groups
+
+    _worker_shm = SharedMemory(name=shm_name)
+    coordinates = _worker_shm.buf.cast("d")
+
+    _worker_lats = coordinates[:station_count]
+    _worker_lons = coordinates[station_count:2 * station_count]
+    _worker_ranks = coordinates[2 * station_count:3 * station_count]
+    _worker_groups = coordinates[3 * station_count:4 * station_count]
+
+    Finalize(None, _release_worker, args=(coordinates,), exitpriority=10)
+
+
+def _release_worker(coordinates):
+    global _worker_lats, _worker_lons, _worker_ranks, _worker_groups
+
+    _worker_lats.release()
+    _worker_lons.release()
+    _worker_ranks.release()
+    _worker_groups.release()
+    coordinates.release()
+    _worker_lats = _worker_lons = _worker_ranks = _worker_groups = None
+    _worker_shm.close()
+
+
+def _ping():
+    return True
+
+
+def _project_chunk(points, mile_markers, max_distance, bbox, per_point_limit):
+    return project_points(
+        points, mile_markers, _worker_lats, _worker_lons, max_distance, bbox,
+        station_ranks=_worker_ranks, station_groups=_worker_groups,
+        per_point_limit=per_point_limit
+    )
+
+
+class ProjectionPool:
+    """
+    Worker pool bound to one station snapshot version.
+
+    Requests hold a reference while they use the pool (see
+    use_projection_pool). A replaced pool is retired: it takes no new
+    users and shuts down once the last one releases it.
+    """
+
+    CHUNKS_PER_WORKER = 4
+
+    def __init__(self, snapshot, workers):
+        self.version = snapshot.version
+        self.workers = workers
+        self.station_count = len(snapshot)
+        self._users = 0
+        self._retired = False
+        self._users_lock = threading.Lock()
+
+        self._shm = SharedMemory(
+            create=True, size=max(32, 32 * self.station_count)
+        )
+        coordinates = self._shm.buf.cast("d")
+        coordinates[:self.station_count] = snapshot.latitudes
+        coordinates[self.station_count:2 * self.station_count] = snapshot.longitudes
+        coordinates[2 * self.station_count:3 * self.station_count] = snapshot.price_ranks
+        coordinates[3 * self.station_count:4 * self.station_count] = snapshot.projection_groups
+        coordinates.release()
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._shm.name, self.station_count),
+        )
+
+    def start(self):
+        """
+        Spawn every worker up front instead of on the first long route.
+        """
+        for future in [self._executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+    def project(self, points, mile_markers, max_distance, bbox=None, per_point_limit=None):
+        """
+        Same result as ``geo.project_points`` over the whole snapshot.
+
+        Chunks are projected independently and concatenated in route
+        order; mile markers are computed by the caller, so no chunk needs
+        to see its neighbours.
+        """
+        chunk_size = max(1, math.ceil(len(points) / (self.workers * self.CHUNKS_PER_WORKER)))
+        starts = range(0, len(points), chunk_size)
+
+        results = self._executor.map(
+            _project_chunk,
+            [points[start:start + chunk_size] for start in starts],
+            [mile_markers[start:start + chunk_size] for start in starts],
+            [max_distance] * len(starts),
+            [bbox] * len(starts),
+            [per_point_limit] * len(starts),
+        )
+
+        matches = []
+        for chunk_matches in results:
+            matches.extend(chunk_matches)
+
+        return matches
+
+    def acquire(self):
+        """
+        Register a user; False once the pool is retired.
+        """
+        with self._users_lock:
+            if self._retired:
+                return False
+            self._users += 1
+            return True
+
+    def release(self):
+        with self._users_lock:
+            self._users -= 1
+            close = self._retired and self._users == 0
+
+        if close:
+            self.close()
+
+    def retire(self):
+        """
+        Take no new users and close as soon as the current ones are done.
+        """
+        with self._users_lock:
+            if self._retired:
+                return
+            self._retired = True
+            close = self._users == 0
+
+        if close:
+            self.close()
+
+    def close(self):
+        # Without waiting: idle workers exit in the background. Workers keep
+        # their mapping of the shared block after it is unlinked
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._shm.close()
+        self._shm.unlink()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _acquire_projection_pool(snapshot, workers):
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None and (_pool.version != snapshot.version or _pool.workers != workers):
+            _pool.retire()
+            _pool = None
+
+        if _pool is None:
+            _pool = ProjectionPool(snapshot, workers)
+
+        # Pools are only retired under _pool_lock, so this cannot fail
+        _pool.acquire()
+        return _pool
+
+
+@contextmanager
+def use_projection_pool(snapshot, workers):
+    """
+    Shared pool for the given snapshot, held for the duration of the
+    block; replaced when the snapshot version or the worker count changes.
+    A replaced pool is not closed while a request still uses it.
+    """
+    pool = _acquire_projection_pool(snapshot, workers)
+    try:
+        yield pool
+    finally:
+        pool.release()
+
+
+def retire_projection_pool(pool):
+    """
+    Stop handing out ``pool`` (e.g. after a worker died), if still current.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+    pool.retire()
+
+
+@atexit.register
+def shutdown_projection_pool():
+    global _pool
+
+    with _pool_lock:
+        pool, _pool = _pool, None
+
+    if pool is not None:
+        pool.retire()
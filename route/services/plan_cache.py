@@ -0,0 +1,178 @@
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class PlanCache:
+    """
+    In-process LRU of planner results, bounded by total size in bytes.
+
+    Values are stored pickled: the stored size is exact, and callers
+    always get their own copy back.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+
+            if data is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+
+            self._entries[key] = data
+            self.bytes += len(data)
+
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+class ProjectionCache:
+    """
+    In-process LRU of route geometry and station projections, bounded by
+    total size in bytes. Holds references rather than copies: the
+    projections point into the shared station snapshot, so a station's own
+    size is not counted, only the route data and projection entries.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def get_size(value):
+        """
+        Approximate bytes held by a (route_data, projected_stations,
+        station_version) entry.
+        """
+        route_data, projected_stations = value[:2]
+
+        size = sys.getsizeof(route_data) + sum(
+            sys.getsizeof(item) for item in route_data.values()
+        )
+
+        if projected_stations:
+            mile, deviation, _ = projected_stations[0]
+            size += sys.getsizeof(projected_stations) + len(projected_stations) * (
+                sys.getsizeof(projected_stations[0]) + sys.getsizeof(mile) + sys.getsizeof(deviation)
+            )
+
+        return size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.get_size(value)
+
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+
+            self._entries[key] = (value, size)
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+_plan_cache = None
+_projection_cache = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache():
+    global _plan_cache
+
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            _plan_cache = PlanCache(getattr(settings, "ROUTE_PLAN_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        return _plan_cache
+
+
+def get_projection_cache():
+    global _projection_cache
+
+    with _plan_cache_lock:
+        if _projection_cache is None:
+            _projection_cache = ProjectionCache(
+                getattr(settings, "ROUTE_PROJECTION_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+            )
+        return _projection_cache
@@ -0,0 +1,271 @@
+import math
+from decimal import Decimal
+
+from route.models import RouteRequest
+from route.services.lane_service import LaneService
+from route.services.ors_service import ORSService
+from route.services.optimization_service import RouteOptimizationService
+from route.services.plan_cache import get_plan_cache, get_projection_cache
+from route.services.station_shards import get_station_version
+from route.services.station_snapshot import ATTR_TRUCK_ACCESSIBLE
+
+
+class RoutePlanningService:
+
+    # Bucket widths for approximate matching of vehicle profiles
+    MPG_BUCKET = 0.5
+    FUEL_BUCKET_GALLONS = 5
+
+    @staticmethod
+    def _quantize(value, step):
+        # Buckets are centred on multiples of step, e.g. [9.75, 10.25) for
+        # 10 mpg, and snap to their lower edge. Values under the lowest
+        # bucket are kept as they are rather than rounded up
+        snapped = (math.floor(value / step + 0.5) - 0.5) * step
+        return snapped if snapped > 0 else value
+
+    @staticmethod
+    def quantize_vehicle(mpg, tank_capacity, initial_fuel):
+        """
+        Snap a vehicle profile down to the lower edge of its bucket.
+
+        Buckets are centred on round values, so near-identical requests
+        (e.g. 9.9 and 10.0 mpg, both 9.75) share one plan, and snapping
+        down never plans for more range than the vehicle has. Approximate
+        requests always get the plan for the snapped profile: computed on
+        a miss, then shared by the rest of the bucket.
+        """
+        mpg = RoutePlanningService._quantize(mpg, RoutePlanningService.MPG_BUCKET)
+        tank_capacity = RoutePlanningService._quantize(
+            tank_capacity, RoutePlanningService.FUEL_BUCKET_GALLONS
+        )
+        initial_fuel = min(
+            tank_capacity,
+            RoutePlanningService._quantize(initial_fuel, RoutePlanningService.FUEL_BUCKET_GALLONS)
+        )
+
+        return float(mpg), float(tank_capacity), float(initial_fuel)
+
+    @staticmethod
+    def get_request_key(start_location, end_location, mpg, tank_capacity, initial_fuel,
+                        departure_time=None, require_truck_access=True, waypoints=(),
+                        allow_approximate=False, alternatives=0):
+        """
+        Normalized identity of a plan request; requests with the same key
+        always produce the same plan.
+        """
+        if allow_approximate:
+            mpg, tank_capacity, initial_fuel = RoutePlanningService.quantize_vehicle(
+                mpg, tank_capacity, initial_fuel
+            )
+
+        route_hash = RouteRequest.build_route_hash(start_location, end_location, waypoints)
+        departure = departure_time.isoformat() if departure_time is not None else ""
+
+        return (
+            f"{route_hash}:{float(mpg)!r}:{float(tank_capacity)!r}:{float(initial_fuel)!r}"
+            f":{departure}:{int(require_truck_access)}:{alternatives}"
+        )
+
+    @staticmethod
+    def get_route_projection(start_location, end_location, waypoints=(), need_duration=False):
+        """
+        Return (route_data, projected_stations) for a route, from the
+        projection cache, a precomputed lane or OSRM, in that order.
+
+        ``route_data`` has no decoded points; ``projected_stations`` is None
+        when no station lies near the route. The geometry is cached per
+        route and the projection with the station snapshot version it was
+        made against, so replanning mid-trip needs no routing, and after a
+        station edit only the projection is redone.
+        """
+        route_hash = RouteRequest.build_route_hash(start_location, end_location, waypoints)
+        station_version = get_station_version()
+        projection_cache = get_projection_cache()
+
+        cached = projection_cache.get(route_hash)
+        if cached is not None and not (need_duration and cached[0].get("duration_seconds") is None):
+            route_data, projected_stations, projected_version = cached
+
+            if projected_version != station_version:
+                # Stations changed: re-project the cached geometry
+                projected_stations = RouteOptimizationService.get_projected_stations(
+                    ORSService.decode_polyline(route_data["polyline"])
+                )
+                projection_cache.set(route_hash, (route_data, projected_stations, station_version))
+
+            return route_data, projected_stations
+
+        lane = LaneService.load_lane(route_hash)
+
+        if lane is not None and need_duration and lane[0].duration_seconds is None:
+            # Lane computed before durations were stored; no ETA possible from it
+            lane = None
+
+        if lane is not None:
+            # Precomputed lane: no routing or station projection needed
+            lane, projected_stations = lane
+            route_data = {
+                "distance_miles": lane.total_distance_miles,
+                "duration_seconds": lane.duration_seconds,
+                "legs": [{
+                    "distance_miles": lane.total_distance_miles,
+                    "duration_seconds": lane.duration_seconds
+                }],
+                "polyline": lane.route_polyline,
+            }
+        else:
+            route_data = ORSService.get_route(start_location, end_location, waypoints=waypoints)
+            projected_stations = RouteOptimizationService.get_projected_stations(
+                route_data["decoded_points"]
+            )
+            route_data = {key: value for key, value in route_data.items() if key != "decoded_points"}
+
+        projection_cache.set(route_hash, (route_data, projected_stations, station_version))
+
+        return route_data, projected_stations
+
+    @staticmethod
+    def plan_route(start_location, end_location, mpg, tank_capacity, initial_fuel,
+                   departure_time=None, require_truck_access=True, waypoints=(),
+                   allow_approximate=False, alternatives=0):
+        """
+        Plan fuel stops for the whole itinerary (start, ordered waypoints,
+        end) in one pass, carrying the tank state across waypoints.
+
+        Stop plans are memoized per route, station snapshot version and
+        vehicle profile. With ``allow_approximate`` the profile is first
+        snapped to its bucket (see quantize_vehicle) and the plan is for
+        the snapped values, which the response reports.
+        """
+        if allow_approximate:
+            mpg, tank_capacity, initial_fuel = RoutePlanningService.quantize_vehicle(
+                mpg, tank_capacity, initial_fuel
+            )
+
+        return RoutePlanningService._plan(
+            start_location, end_location, mpg, tank_capacity, initial_fuel,
+            departure_time, require_truck_access, waypoints, alternatives,
+            extra={"approximate": True} if allow_approximate else None
+        )
+
+    @staticmethod
+    def replan_route(start_location, end_location, mpg, tank_capacity, current_mile,
+                     current_fuel, departure_time=None, require_truck_access=True,
+                     waypoints=(), alternatives=0):
+        """
+        Plan the rest of a trip from ``current_mile`` with ``current_fuel``
+        gallons left, e.g. after the driver skipped a planned stop.
+        ``departure_time`` is when the vehicle is at ``current_mile``.
+
+        Mile markers stay relative to the route start. Reuses the cached
+        geometry and station projection of the original plan.
+        """
+        return RoutePlanningService._plan(
+            start_location, end_location, mpg, tank_capacity, current_fuel,
+            departure_time, require_truck_access, waypoints, alternatives,
+            start_mile=current_mile,
+            extra={"replanned_from_mile": current_mile}
+        )
+
+    @staticmethod
+    def _plan(start_location, end_location, mpg, tank_capacity, initial_fuel,
+              departure_time, require_truck_access, waypoints, alternatives,
+              start_mile=0.0, extra=None):
+        route_data, projected_stations = RoutePlanningService.get_route_projection(
+            start_location, end_location, waypoints, need_duration=departure_time is not None
+        )
+
+        total_distance = route_data["distance_miles"]
+        eta_at = RouteOptimizationService.build_eta(
+            route_data.get("legs"), departure_time, start_mile
+        )
+
+        if departure_time is not None and eta_at is None:
+            raise Exception("Route duration unavailable; cannot plan against opening hours.")
+
+        required_attributes = ATTR_TRUCK_ACCESSIBLE if require_truck_access else 0
+
+        # Stops depend only on the route, station prices and the vehicle
+        plan_key = (
+            RouteRequest.build_route_hash(start_location, end_location, waypoints),
+            get_station_version(),
+            float(mpg),
+            float(tank_capacity),
+            float(initial_fuel),
+            required_attributes,
+            departure_time.isoformat() if departure_time is not None else None,
+            float(start_mile),
+            alternatives,
+        )
+        plan_cache = get_plan_cache()
+        plan = plan_cache.get(plan_key)
+
+        if plan is None:
+            if projected_stations is None:
+                # No station anywhere near the route
+                plan = [], Decimal("0.00"), Decimal("0.00"), Decimal(str(initial_fuel))
+            else:
+                plan = RouteOptimizationService.calculate_realistic_stops(
+                    total_distance=total_distance,
+                    mpg=mpg,
+                    tank_capacity=tank_capacity,
+                    initial_fuel=initial_fuel,
+                    projected_stations=projected_stations,
+                    required_attributes=required_attributes,
+                    eta_at=eta_at,
+                    start_mile=start_mile,
+                    alternatives=alternatives
+                )
+            plan_cache.set(plan_key, plan)
+
+        stops, total_cost, total_fuel_used, fuel_remaining = plan
+
+        result = {
+            "start_location": start_location,
+            "end_location": end_location,
+            "total_distance_miles": round(total_distance, 2),
+            "total_stops": len(stops),
+            "vehicle_mpg": mpg,
+            "tank_capacity": tank_capacity,
+            "initial_fuel": initial_fuel,
+            "total_fuel_used": round(float(total_fuel_used), 2),
+            "total_fuel_cost": round(float(total_cost), 2),
+            "fuel_remaining_at_destination": round(float(fuel_remaining), 2),
+            "fuel_stops": stops,
+            "route_polyline": route_data["polyline"]
+        }
+
+        if extra:
+            result.update(extra)
+
+        if waypoints:
+            result["waypoints"] = RoutePlanningService.get_waypoint_markers(
+                waypoints, route_data["legs"], eta_at
+            )
+
+        if departure_time is not None:
+            result["departure_time"] = departure_time.isoformat()
+            result["arrival_time"] = eta_at(total_distance).isoformat()
+
+        return result
+
+    @staticmethod
+    def get_waypoint_markers(waypoints, legs, eta_at=None):
+        """
+        Where each waypoint falls along the trip: OSRM returns one leg per
+        consecutive pair of locations, so waypoint i ends leg i.
+        """
+        markers = []
+        miles = 0.0
+
+        for location, leg in zip(waypoints, legs):
+            miles += leg["distance_miles"]
+            marker = {"location": location, "miles_from_start": round(miles, 2)}
+
+            if eta_at is not None:
+                marker["eta"] = eta_at(miles).isoformat()
+
+            markers.append(marker)
+
+        return markers
@@ -0,0 +1,171 @@
+"""
+Token-bucket rate limiting for outbound requests, shared by every worker
+process on the host through a small SQLite file.
+
+Waiting callers are queued in the same file, so interactive requests are
+always granted before background ones (e.g. bulk geocoding) and the queue
+depth can be reported.
+"""
+import os
+import sqlite3
+import time
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+class TokenBucketScheduler:
+
+    POLL_INTERVAL = 0.05
+
+    # Waiters refresh their heartbeat on every poll; entries that stop doing
+    # so belong to dead processes and are dropped from the queue
+    STALE_WAITER_SECONDS = 30
+
+    def __init__(self, path, name, rate, burst=1):
+        self.path = str(path)
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._ensure_schema()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def _ensure_schema(self):
+        connection = self._connect()
+
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS waiters ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,"
+                " priority INTEGER NOT NULL, pid INTEGER NOT NULL, heartbeat REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS waiters_queue ON waiters (name, priority, id)"
+            )
+            connection.execute(
+                "INSERT OR IGNORE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (self.name, self.burst, time.time())
+            )
+        finally:
+            connection.close()
+
+    def acquire(self, priority=INTERACTIVE, max_wait=None):
+        """
+        Block until a token is granted to this caller.
+
+        Raises RateLimitTimeout if none is granted within ``max_wait``
+        seconds.
+        """
+        connection = self._connect()
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        waiter_id = None
+
+        try:
+            waiter_id = connection.execute(
+                "INSERT INTO waiters (name, priority, pid, heartbeat) VALUES (?, ?, ?, ?)",
+                (self.name, priority, os.getpid(), time.time())
+            ).lastrowid
+
+            while True:
+                delay = self._try_acquire(connection, waiter_id)
+
+                if delay is None:
+                    waiter_id = None
+                    return
+
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise RateLimitTimeout(
+                        f"No {self.name} request slot within {max_wait}s"
+                    )
+
+                time.sleep(delay)
+        finally:
+            if waiter_id is not None:
+                connection.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+            connection.close()
+
+    def _try_acquire(self, connection, waiter_id):
+        """
+        Take a token if this waiter is at the head of the queue. Returns
+        None on success, otherwise how long to sleep before trying again.
+        """
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            now = time.time()
+
+            connection.execute(
+                "UPDATE waiters SET heartbeat = ? WHERE id = ?",
+                (now, waiter_id)
+            )
+            connection.execute(
+                "DELETE FROM waiters WHERE name = ? AND heartbeat < ?",
+                (self.name, now - self.STALE_WAITER_SECONDS)
+            )
+
+            head = connection.execute(
+                "SELECT id FROM waiters WHERE name = ? ORDER BY priority, id LIMIT 1",
+                (self.name,)
+            ).fetchone()
+
+            tokens, updated = connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE name = ?",
+                (self.name,)
+            ).fetchone()
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if head is None or head[0] != waiter_id:
+                connection.execute("COMMIT")
+                return self.POLL_INTERVAL
+
+            if tokens < 1:
+                connection.execute(
+                    "UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?",
+                    (tokens, now, self.name)
+                )
+                connection.execute("COMMIT")
+                return max(self.POLL_INTERVAL, (1 - tokens) / self.rate)
+
+            connection.execute(
+                "UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?",
+                (tokens - 1, now, self.name)
+            )
+            connection.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+            connection.execute("COMMIT")
+            return None
+
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def queue_depth(self):
+        connection = self._connect()
+
+        try:
+            rows = connection.execute(
+                "SELECT priority, COUNT(*) FROM waiters"
+                " WHERE name = ? AND heartbeat >= ? GROUP BY priority",
+                (self.name, time.time() - self.STALE_WAITER_SECONDS)
+            ).fetchall()
+        finally:
+            connection.close()
+
+        depth = {label: 0 for label in PRIORITY_NAMES.values()}
+        for priority, count in rows:
+            depth[PRIORITY_NAMES.get(priority, str(priority))] = count
+
+        return depth
@@ -0,0 +1,298 @@
+"""
+Shared resilience layer for outbound HTTP calls (Nominatim, OSRM).
+
+Each upstream gets one ``ResilientClient`` per process with an adaptive
+timeout, a circuit breaker, optional hedged requests and an optional
+host-wide rate limit, configured through the OUTBOUND_UPSTREAMS setting.
+
+``requests`` is imported on first use so processes that never call out
+(management commands, warm-up) do not pay for it.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.conf import settings
+
+from route.services.rate_limiter import INTERACTIVE, RateLimitTimeout, TokenBucketScheduler
+
+
+class UpstreamUnavailable(Exception):
+    """
+    The upstream is failing fast (circuit open) or every attempt failed.
+    """
+
+    def __init__(self, upstream, reason):
+        super().__init__(f"{upstream} unavailable: {reason}")
+        self.upstream = upstream
+
+
+class AdaptiveTimeout:
+    """
+    Timeout derived from observed latency (smoothed mean + 4 deviations,
+    as TCP does for retransmission timers), clamped to [minimum, maximum].
+    Starts at the maximum until latencies have been observed.
+    """
+
+    ALPHA = 0.125
+    BETA = 0.25
+
+    def __init__(self, minimum, maximum):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = None
+        self.deviation = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, latency):
+        with self._lock:
+            if self.mean is None:
+                self.mean = latency
+                self.deviation = latency / 2
+            else:
+                self.deviation += self.BETA * (abs(latency - self.mean) - self.deviation)
+                self.mean += self.ALPHA * (latency - self.mean)
+
+    def timeout(self):
+        if self.mean is None:
+            return self.maximum
+        return min(self.maximum, max(self.minimum, self.mean + 4 * self.deviation))
+
+    def hedge_delay(self):
+        """
+        How long to wait before sending a hedged duplicate request: roughly
+        the latency most calls finish within.
+        """
+        if self.mean is None:
+            return self.minimum
+        return min(self.timeout(), max(0.05, self.mean + 2 * self.deviation))
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and fails fast
+    for ``reset_timeout`` seconds; then lets one trial call through
+    (half-open) and closes again if it succeeds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        with self._lock:
+            state = self.state
+
+            if state == self.CLOSED:
+                return True
+
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def cancel_trial(self):
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class ResilientClient:
+
+    RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+    DEFAULTS = {
+        "min_timeout": 2,
+        "max_timeout": 15,
+        "retries": 1,
+        "retry_backoff": 0.5,
+        "hedge": False,
+        "failure_threshold": 5,
+        "reset_timeout": 30,
+        "rate_limit": None,
+        "burst": 1,
+        "max_queue_wait": 10,
+    }
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, name, **config):
+        self.name = name
+        self.config = {**self.DEFAULTS, **config}
+        self.timeout = AdaptiveTimeout(self.config["min_timeout"], self.config["max_timeout"])
+        self.breaker = CircuitBreaker(self.config["failure_threshold"], self.config["reset_timeout"])
+
+        self.scheduler = None
+        if self.config["rate_limit"]:
+            self.scheduler = TokenBucketScheduler(
+                settings.OUTBOUND_RATE_LIMIT_DB,
+                name,
+                rate=self.config["rate_limit"],
+                burst=self.config["burst"]
+            )
+
+    @classmethod
+    def _get_executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+
+                cls._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="outbound")
+            return cls._executor
+
+    def _send(self, url, params, headers, timeout, priority):
+        import requests
+
+        if self.scheduler is not None:
+            # Interactive callers give up after max_queue_wait; background jobs wait their turn
+            self.scheduler.acquire(
+                priority,
+                max_wait=self.config["max_queue_wait"] if priority == INTERACTIVE else None
+            )
+
+        started = time.monotonic()
+        response = requests.get(url, params=params, headers=headers, timeout=timeout)
+
+        if response.status_code in self.RETRYABLE_STATUS:
+            raise requests.exceptions.HTTPError(
+                f"{response.status_code} from {self.name}", response=response
+            )
+
+        self.timeout.observe(time.monotonic() - started)
+        return response
+
+    def _send_hedged(self, url, params, headers, timeout, priority):
+        executor = self._get_executor()
+        primary = executor.submit(self._send, url, params, headers, timeout, priority)
+        done, _ = wait([primary], timeout=self.timeout.hedge_delay())
+
+        if done:
+            return primary.result()
+
+        # Primary is slow: race a duplicate and take whichever succeeds first
+        pending = {primary, executor.submit(self._send, url, params, headers, timeout, priority)}
+        error = None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+
+        raise error
+
+    def get(self, url, params=None, headers=None, hedge=None, retries=None,
+            retry_backoff=None, priority=INTERACTIVE):
+        """
+        GET with rate limiting, adaptive timeout, retries on transient
+        failures and the circuit breaker. Returns the response (non-retryable
+        4xx included, so callers still ``raise_for_status``); raises
+        UpstreamUnavailable when the upstream is degraded or the rate-limit
+        queue is too long for an interactive caller.
+        """
+        import requests
+
+        hedge = self.config["hedge"] if hedge is None else hedge
+        retries = self.config["retries"] if retries is None else retries
+        retry_backoff = self.config["retry_backoff"] if retry_backoff is None else retry_backoff
+
+        last_error = None
+
+        for attempt in range(retries + 1):
+            if not self.breaker.allow_request():
+                raise UpstreamUnavailable(self.name, "circuit open")
+
+            timeout = self.timeout.timeout()
+
+            try:
+                if hedge:
+                    response = self._send_hedged(url, params, headers, timeout, priority)
+                else:
+                    response = self._send(url, params, headers, timeout, priority)
+            except RateLimitTimeout as e:
+                # Never reached the upstream, so this says nothing about its health
+                self.breaker.cancel_trial()
+                raise UpstreamUnavailable(self.name, str(e)) from e
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                last_error = e
+
+                if attempt < retries:
+                    time.sleep(retry_backoff * (attempt + 1))
+                continue
+            except BaseException:
+                # Not an upstream failure (e.g. the rate limiter's database is
+                # locked); release a half-open trial so later calls can retry
+                self.breaker.cancel_trial()
+                raise
+
+            self.breaker.record_success()
+            return response
+
+        raise UpstreamUnavailable(self.name, str(last_error)) from last_error
+
+    def status(self):
+        status = {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "timeout_seconds": round(self.timeout.timeout(), 3),
+        }
+
+        if self.scheduler is not None:
+            status["queue_depth"] = self.scheduler.queue_depth()
+
+        return status
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    with _clients_lock:
+        if name not in _clients:
+            config = getattr(settings, "OUTBOUND_UPSTREAMS", {}).get(name, {})
+            _clients[name] = ResilientClient(name, **config)
+        return _clients[name]
+
+
+def get_upstream_status():
+    """
+    Status of every configured upstream, for the metrics endpoint.
+    """
+    return {
+        name: get_client(name).status()
+        for name in getattr(settings, "OUTBOUND_UPSTREAMS", {})
+    }
@@ -0,0 +1,178 @@
+import time
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from route.models import FuelStop, RouteGeometry, RouteRequest
+
+
+class RetentionService:
+    """
+    Keeps the plan history bounded. Every step walks the table in primary
+    key order, one short transaction per batch, so locks stay brief and
+    freed pages are reused gradually instead of needing a full VACUUM.
+    """
+
+    @staticmethod
+    def compact_polylines(batch_size=500):
+        """
+        Move inline polylines into the shared, compressed RouteGeometry
+        table, one geometry per distinct (route_hash, polyline).
+
+        Returns (requests_compacted, geometries_created).
+        """
+        compacted = 0
+        created = 0
+        last_id = 0
+
+        while True:
+            batch = list(
+                RouteRequest.objects
+                .filter(id__gt=last_id)
+                .exclude(route_polyline="")
+                .order_by("id")
+                .only("id", "start_location", "end_location", "route_hash", "route_polyline")
+                [:batch_size]
+            )
+
+            if not batch:
+                break
+
+            last_id = batch[-1].pk
+
+            keys = {
+                request.pk: (
+                    request.route_hash or RouteRequest.build_route_hash(
+                        request.start_location, request.end_location
+                    ),
+                    RouteGeometry.build_polyline_hash(request.route_polyline),
+                )
+                for request in batch
+            }
+
+            with transaction.atomic():
+                geometry_ids = {
+                    (route_hash, polyline_hash): pk
+                    # Both columns, so the (route_hash, polyline_hash) index is used
+                    for pk, route_hash, polyline_hash in RouteGeometry.objects.filter(
+                        route_hash__in={key[0] for key in keys.values()},
+                        polyline_hash__in={key[1] for key in keys.values()}
+                    ).values_list("id", "route_hash", "polyline_hash")
+                }
+
+                for request in batch:
+                    key = keys[request.pk]
+
+                    if key not in geometry_ids:
+                        geometry_ids[key] = RouteGeometry.objects.create(
+                            route_hash=key[0],
+                            polyline_hash=key[1],
+                            polyline_compressed=RouteGeometry.compress(request.route_polyline),
+                            polyline_length=len(request.route_polyline),
+                        ).pk
+                        created += 1
+
+                    request.geometry_id = geometry_ids[key]
+                    request.route_polyline = ""
+
+                RouteRequest.objects.bulk_update(batch, ["geometry", "route_polyline"])
+
+            compacted += len(batch)
+
+        return compacted, created
+
+    @staticmethod
+    def prune_fuel_stops(created_before, batch_size=500, pause=0.0):
+        """
+        Replace the FuelStop rows of plans created before ``created_before``
+        with a per-plan summary (stop count, gallons, cost), ``batch_size``
+        plans per transaction, sleeping ``pause`` seconds between batches.
+
+        Returns (plans_summarized, stops_deleted).
+        """
+        summarized = 0
+        deleted = 0
+        last_id = 0
+
+        while True:
+            plan_ids = list(
+                RouteRequest.objects
+                .filter(id__gt=last_id, created_at__lt=created_before, fuel_stop_summary__isnull=True)
+                .order_by("id")
+                .values_list("id", flat=True)
+                [:batch_size]
+            )
+
+            if not plan_ids:
+                break
+
+            last_id = plan_ids[-1]
+
+            with transaction.atomic():
+                totals = {
+                    row["route_id"]: row
+                    for row in FuelStop.objects
+                    .filter(route_id__in=plan_ids)
+                    .values("route_id")
+                    .annotate(stops=Count("id"), gallons=Sum("gallons_filled"), cost=Sum("cost"))
+                }
+
+                plans = []
+                for plan_id in plan_ids:
+                    row = totals.get(plan_id)
+                    plans.append(RouteRequest(
+                        id=plan_id,
+                        fuel_stop_summary={
+                            "stops": row["stops"] if row else 0,
+                            "gallons_filled": round(row["gallons"], 2) if row else 0.0,
+                            "cost": round(float(row["cost"]), 2) if row else 0.0,
+                        }
+                    ))
+
+                RouteRequest.objects.bulk_update(plans, ["fuel_stop_summary"])
+                batch_deleted, _ = FuelStop.objects.filter(route_id__in=plan_ids).delete()
+
+            summarized += len(plan_ids)
+            deleted += batch_deleted
+
+            if pause:
+                time.sleep(pause)
+
+        return summarized, deleted
+
+    @staticmethod
+    def prune_unused_geometries(batch_size=500):
+        """
+        Delete geometries no longer referenced by any request, by primary
+        key, ``batch_size`` per transaction; the compressed polylines are
+        never loaded.
+        """
+        deleted = 0
+        last_id = 0
+
+        while True:
+            geometry_ids = list(
+                RouteGeometry.objects
+                .filter(id__gt=last_id, requests__isnull=True)
+                .order_by("id")
+                .values_list("id", flat=True)
+                [:batch_size]
+            )
+
+            if not geometry_ids:
+                break
+
+            last_id = geometry_ids[-1]
+
+            with transaction.atomic():
+                # Re-checked: a request may have been pointed at it meanwhile
+                batch_deleted, _ = (
+                    RouteGeometry.objects
+                    .filter(id__in=geometry_ids, requests__isnull=True)
+                    .only("id")
+                    .delete()
+                )
+
+            deleted += batch_deleted
+
+        return deleted
@@ -0,0 +1,211 @@
+"""
+Geographic sharding of the station set.
+
+With ROUTE_STATION_SHARDING enabled, workers no longer hold every station
+in memory. Stations are partitioned into geohash tiles (cells of
+ROUTE_STATION_TILE_PRECISION characters). Each process keeps a shard map,
+tile -> signature, refreshed from one grouped query at most once per
+STATION_SNAPSHOT_TTL seconds. A tile's stations are loaded the first time
+a route corridor (or a nearest-station search) touches it. At most
+ROUTE_STATION_SHARD_CACHE_SIZE tiles stay loaded, least recently used
+first out.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Floor
+
+from route.models import FuelStation
+from route.services import geo
+from route.services.station_snapshot import StationSnapshot
+
+
+def sharding_enabled():
+    return getattr(settings, "ROUTE_STATION_SHARDING", False)
+
+
+def get_station_version():
+    """
+    Version of the station set, for cache keys; does not load stations
+    when sharding is enabled.
+    """
+    if sharding_enabled():
+        return StationShardMap.current().version
+    return StationSnapshot.current().version
+
+
+def get_corridor_stations(points, distance_miles):
+    """
+    Snapshot holding at least every station within ``distance_miles`` of
+    ``points``: the loaded tiles the corridor touches, or the full
+    snapshot without sharding.
+    """
+    if sharding_enabled():
+        return StationShardMap.current().corridor_snapshot(points, distance_miles)
+    return StationSnapshot.current()
+
+
+class StationShardMap:
+
+    _current = None
+    _checked_at = None
+    _lock = threading.Lock()
+
+    def __init__(self, precision, max_tiles):
+        self.precision = precision
+        self.max_tiles = max_tiles
+        self.tile_versions = {}
+        self.version = None
+        self._shards = OrderedDict()
+        self._shards_lock = threading.Lock()
+        self.loads = 0
+
+    def __len__(self):
+        return len(self.tile_versions)
+
+    def get_tile_versions(self):
+        """
+        Signature of every non-empty tile, from one grouped query.
+        """
+        lat_size, lon_size = geo.geohash_cell_size(self.precision)
+        max_row, max_column = geo.geohash_cell(90.0, 180.0, self.precision)
+
+        rows = (
+            FuelStation.objects
+            .filter(is_geocoded=True)
+            .annotate(
+                tile_row=Floor((F("latitude") + 90) / lat_size),
+                tile_column=Floor((F("longitude") + 180) / lon_size),
+            )
+            .values("tile_row", "tile_column")
+            .annotate(**StationSnapshot.signature_aggregates())
+            .order_by()
+        )
+
+        tile_versions = {}
+        for row in rows:
+            # Stations on the north or east edge of the world belong to the
+            # last cell, as in geo.geohash_cell
+            tile = geo.geohash_from_cell(
+                min(int(row.pop("tile_row")), max_row),
+                min(int(row.pop("tile_column")), max_column),
+                self.precision
+            )
+            tile_versions[tile] = tile_versions.get(tile, "") + StationSnapshot.hash_signature(row)
+
+        return tile_versions
+
+    def load_tile(self, tile):
+        cell = geo.geohash_to_cell(tile)
+        min_lat, max_lat, min_lon, max_lon = geo.geohash_bounds(tile)
+
+        # Padded range query on the (latitude, longitude) index; stations
+        # are assigned to tiles with the same arithmetic as the shard map
+        stations = (
+            FuelStation.objects
+            .filter(
+                is_geocoded=True,
+                latitude__gte=min_lat - 1e-6,
+                latitude__lte=max_lat + 1e-6,
+                longitude__gte=min_lon - 1e-6,
+                longitude__lte=max_lon + 1e-6,
+            )
+            .only(*StationSnapshot.FIELDS)
+        )
+
+        return StationSnapshot(
+            [
+                station for station in stations
+                if geo.geohash_cell(station.latitude, station.longitude, self.precision) == cell
+            ],
+            version=self.tile_versions.get(tile)
+        )
+
+    def get_shard(self, tile):
+        version = self.tile_versions.get(tile)
+
+        if version is None:
+            # No stations in this tile
+            return None
+
+        with self._shards_lock:
+            shard = self._shards.get(tile)
+            if shard is not None and shard.version == version:
+                self._shards.move_to_end(tile)
+                return shard
+
+        # Loaded outside the lock; a concurrent duplicate load is harmless
+        shard = self.load_tile(tile)
+
+        with self._shards_lock:
+            self._shards[tile] = shard
+            self._shards.move_to_end(tile)
+            self.loads += 1
+
+            while len(self._shards) > self.max_tiles:
+                self._shards.popitem(last=False)
+
+        return shard
+
+    def corridor_snapshot(self, points, distance_miles):
+        tiles = geo.corridor_geohashes(points, distance_miles, self.precision)
+
+        stations = []
+        for tile in sorted(tiles):
+            shard = self.get_shard(tile)
+            if shard is not None:
+                stations.extend(shard.stations)
+
+        return StationSnapshot(stations, version=self.version, annotated=True)
+
+    def stats(self):
+        with self._shards_lock:
+            return {
+                "tiles": len(self.tile_versions),
+                "loaded_tiles": len(self._shards),
+                "loaded_stations": sum(len(shard) for shard in self._shards.values()),
+                "loads": self.loads,
+            }
+
+    def refresh(self, tile_versions):
+        """
+        Adopt new tile signatures; changed tiles reload on next use.
+        """
+        with self._shards_lock:
+            self.tile_versions = tile_versions
+            self.version = StationSnapshot.hash_signature(tile_versions)
+
+            for tile in [tile for tile in self._shards if tile not in tile_versions]:
+                del self._shards[tile]
+
+    @classmethod
+    def current(cls):
+        """
+        Process-wide shard map; tile signatures are re-checked at most once
+        every STATION_SNAPSHOT_TTL seconds.
+        """
+        ttl = getattr(settings, "STATION_SNAPSHOT_TTL", 60)
+
+        with cls._lock:
+            now = time.monotonic()
+
+            if cls._current is None:
+                cls._current = cls(
+                    getattr(settings, "ROUTE_STATION_TILE_PRECISION", 3),
+                    getattr(settings, "ROUTE_STATION_SHARD_CACHE_SIZE", 256)
+                )
+                cls._checked_at = None
+
+            if cls._checked_at is None or now - cls._checked_at >= ttl:
+                cls._current.refresh(cls._current.get_tile_versions())
+                cls._checked_at = now
+
+            return cls._current
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._current = None
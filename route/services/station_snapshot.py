@@ -0,0 +1,273 @@
+import hashlib
+import heapq
+import os
+import pickle
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db.models import Count, DecimalField, F, FloatField, IntegerField, Max, Q, Sum
+from django.db.models.functions import ExtractHour, ExtractMinute
+
+from route.models import FuelStation
+from route.services import geo
+
+# Station attribute bits, precomputed per station as ``attribute_mask`` so
+# planners filter candidates with one integer test
+ATTR_TRUCK_ACCESSIBLE = 1
+ATTR_ALWAYS_OPEN = 2
+
+
+def get_attribute_mask(station):
+    mask = 0
+
+    if station.truck_accessible:
+        mask |= ATTR_TRUCK_ACCESSIBLE
+    if station.opens_at is None or station.closes_at is None or station.opens_at == station.closes_at:
+        mask |= ATTR_ALWAYS_OPEN
+
+    return mask
+
+
+def get_projection_group(station):
+    """
+    Key under which the per-point candidate bound ranks stations: the
+    attribute mask, plus the opening-hours window for stations that close.
+    Stations at one route point share an ETA, so within a group they are
+    open or closed together and the cheapest ones stand for the rest.
+    """
+    if station.attribute_mask & ATTR_ALWAYS_OPEN:
+        return station.attribute_mask
+
+    window = (
+        (station.opens_at.hour * 60 + station.opens_at.minute) * 1440
+        + station.closes_at.hour * 60 + station.closes_at.minute
+    )
+
+    return station.attribute_mask + 4 * (window + 1)
+
+
+def get_price_rank(station):
+    """
+    Sort key equivalent to (retail_price, pk), packed into one float (exact
+    for prices below $1000 and ids below 2**32) so it fits the shared float
+    arrays and compares the same across snapshots and shards.
+    """
+    return float(int(station.retail_price * 1000) * 2 ** 32 + station.pk)
+
+
+class StationSnapshot:
+    """
+    In-memory, latitude-sorted copy of the geocoded fuel stations.
+
+    ``latitudes``/``longitudes`` are flat float arrays parallel to
+    ``stations`` so they can be bisected and shared with worker processes
+    without touching the model instances.
+    """
+
+    FIELDS = (
+        "id", "name", "city", "state", "retail_price", "latitude", "longitude",
+        "truck_accessible", "opens_at", "closes_at",
+    )
+
+    _current = None
+    _checked_at = None
+    _lock = threading.Lock()
+
+    def __init__(self, stations, version=None, annotated=False):
+        self.stations = sorted(stations, key=lambda s: (s.latitude, s.pk))
+
+        # Sub-snapshots reuse the annotations of the snapshot they came from
+        if not annotated:
+            for station in self.stations:
+                station.price_rank = get_price_rank(station)
+                station.attribute_mask = get_attribute_mask(station)
+                station.projection_group = get_projection_group(station)
+
+        self.latitudes = array("d", (s.latitude for s in self.stations))
+        self.longitudes = array("d", (s.longitude for s in self.stations))
+        self.price_ranks = array("d", (s.price_rank for s in self.stations))
+        self.attribute_masks = array("d", (s.attribute_mask for s in self.stations))
+        self.projection_groups = array("d", (s.projection_group for s in self.stations))
+        self.version = version
+        self._by_id = None
+
+    def __len__(self):
+        return len(self.stations)
+
+    @property
+    def by_id(self):
+        if self._by_id is None:
+            self._by_id = {station.pk: station for station in self.stations}
+        return self._by_id
+
+    def within_bbox(self, min_lat, max_lat, min_lon, max_lon):
+        """
+        Sub-snapshot of the stations inside the bounding box.
+        """
+        lo = bisect_left(self.latitudes, min_lat)
+        hi = bisect_right(self.latitudes, max_lat)
+
+        return StationSnapshot(
+            [
+                station for station in self.stations[lo:hi]
+                if min_lon <= station.longitude <= max_lon
+            ],
+            version=self.version,
+            annotated=True
+        )
+
+    def cheapest_within(self, latitude, longitude, radius_miles, limit, required_attributes=0):
+        """
+        The ``limit`` cheapest stations within ``radius_miles`` of the
+        point, as (distance_miles, station) pairs; ties go to the closer
+        station.
+        """
+        band = geo.latitude_band(radius_miles)
+        lon_band = geo.longitude_band(latitude, radius_miles)
+
+        lo = bisect_left(self.latitudes, latitude - band)
+        hi = bisect_right(self.latitudes, latitude + band)
+
+        candidates = []
+
+        for index in range(lo, hi):
+            station = self.stations[index]
+
+            if station.attribute_mask & required_attributes != required_attributes:
+                continue
+
+            # Wrap-around safe longitude difference
+            if abs((self.longitudes[index] - longitude + 180) % 360 - 180) > lon_band:
+                continue
+
+            distance = geo.haversine(latitude, longitude, self.latitudes[index], self.longitudes[index])
+
+            if distance <= radius_miles:
+                candidates.append((station.retail_price, distance, station.pk, station))
+
+        return [
+            (distance, station)
+            for _, distance, _, station in heapq.nsmallest(limit, candidates, key=lambda c: c[:3])
+        ]
+
+    @staticmethod
+    def get_version():
+        """
+        Cheap signature of the geocoded station set; changes whenever
+        stations are added, removed or saved (``updated_at``). Prices,
+        positions, hours and truck access are also summed weighted by id,
+        so they are covered even when changed with QuerySet.update(),
+        which does not bump ``updated_at``.
+        """
+        signature = FuelStation.objects.filter(is_geocoded=True).aggregate(
+            **StationSnapshot.signature_aggregates()
+        )
+
+        return StationSnapshot.hash_signature(signature)
+
+    @staticmethod
+    def signature_aggregates():
+        def weighted(expression, output_field):
+            # Weighting by id makes swapping values between stations count
+            return Sum(F("id") * expression, output_field=output_field)
+
+        def minutes(field):
+            return ExtractHour(field) * 60 + ExtractMinute(field)
+
+        return {
+            "count": Count("id"),
+            "max_id": Max("id"),
+            "updated": Max("updated_at"),
+            "prices": weighted(F("retail_price"), DecimalField()),
+            "latitudes": weighted(F("latitude"), FloatField()),
+            "longitudes": weighted(F("longitude"), FloatField()),
+            "restricted": Sum("id", filter=Q(truck_accessible=False)),
+            "opens": weighted(minutes("opens_at"), IntegerField()),
+            "closes": weighted(minutes("closes_at"), IntegerField()),
+        }
+
+    @staticmethod
+    def hash_signature(signature):
+        return hashlib.sha1(
+            repr(sorted(signature.items())).encode()
+        ).hexdigest()[:16]
+
+    @classmethod
+    def build(cls, version=None):
+        version = version or cls.get_version()
+        stations = FuelStation.objects.filter(is_geocoded=True).only(*cls.FIELDS)
+
+        return cls(list(stations), version=version)
+
+    @classmethod
+    def current(cls):
+        """
+        Process-wide snapshot, rebuilt when the station set changes.
+
+        The version is re-checked at most once every STATION_SNAPSHOT_TTL
+        seconds.
+        """
+        ttl = getattr(settings, "STATION_SNAPSHOT_TTL", 60)
+
+        with cls._lock:
+            now = time.monotonic()
+
+            if cls._current is None or cls._checked_at is None or now - cls._checked_at >= ttl:
+                version = cls.get_version()
+
+                if cls._current is None or cls._current.version != version:
+                    cls._current = cls.build(version)
+
+                cls._checked_at = now
+
+            return cls._current
+
+    @classmethod
+    def install(cls, snapshot, verified=False):
+        """
+        Make ``snapshot`` the process-wide one. Unless ``verified``, its
+        version is checked against the database on the next ``current()``.
+        """
+        with cls._lock:
+            cls._current = snapshot
+            cls._checked_at = time.monotonic() if verified else None
+
+    def save(self, path):
+        rows = [tuple(getattr(station, field) for field in self.FIELDS) for station in self.stations]
+
+        # Write then rename, so running workers never read a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(
+                {"fields": self.FIELDS, "version": self.version, "rows": rows},
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Snapshot previously written by ``save``, or None if the file is
+        missing or was written with a different field layout.
+        """
+        try:
+            with open(path, "rb") as file:
+                data = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        if data.get("fields") != cls.FIELDS:
+            return None
+
+        stations = [FuelStation(**dict(zip(cls.FIELDS, row))) for row in data["rows"]]
+
+        return cls(stations, version=data["version"])
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._current = None
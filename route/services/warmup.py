@@ -0,0 +1,111 @@
+import logging
+import time
+import warnings
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from route.services.station_shards import StationShardMap, sharding_enabled
+from route.services.station_snapshot import StationSnapshot
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Filled in by warm_up(); reported by the metrics endpoint
+warmup_report = {}
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def warm_up():
+    """
+    Load the station snapshot and build the routing-side structures so the
+    first request is served at steady-state latency.
+
+    Prefers the on-disk snapshot at STATION_SNAPSHOT_PATH (no database access;
+    its version is verified on the first request) and falls back to the
+    database. With station sharding only the shard map is loaded; tiles
+    load with the first routes that touch them.
+    """
+    started = time.perf_counter()
+    rss_before = _max_rss_mb()
+
+    if sharding_enabled():
+        return _warm_up_shard_map(started, rss_before)
+
+    snapshot = StationSnapshot.load(settings.STATION_SNAPSHOT_PATH)
+    source = "disk"
+
+    if snapshot is None:
+        source = "database"
+        try:
+            with warnings.catch_warnings():
+                # Querying from AppConfig.ready() is deliberate here (opt-in warm-up)
+                warnings.simplefilter("ignore", RuntimeWarning)
+                snapshot = StationSnapshot.build()
+        except DatabaseError as e:
+            # Serve cold rather than refusing to start
+            logger.warning("Route warm-up skipped: %s", e)
+            return warmup_report
+
+    StationSnapshot.install(snapshot, verified=source == "database")
+    snapshot.by_id  # build the id index used by precomputed lanes
+
+    workers = getattr(settings, "ROUTE_PROJECTION_WORKERS", 0)
+    if workers > 1:
+        from route.services.parallel_projection import use_projection_pool
+
+        with use_projection_pool(snapshot, workers) as pool:
+            pool.start()
+
+    warmup_report.update({
+        "source": source,
+        "stations": len(snapshot),
+        "snapshot_version": snapshot.version,
+        "seconds": round(time.perf_counter() - started, 3),
+        "max_rss_mb_before": rss_before,
+        "max_rss_mb_after": _max_rss_mb(),
+    })
+
+    logger.info(
+        "Route warm-up: %(stations)d stations from %(source)s in %(seconds).3fs "
+        "(max RSS %(max_rss_mb_before)s -> %(max_rss_mb_after)s MB)",
+        warmup_report
+    )
+
+    return warmup_report
+
+
+def _warm_up_shard_map(started, rss_before):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            shard_map = StationShardMap.current()
+    except DatabaseError as e:
+        logger.warning("Route warm-up skipped: %s", e)
+        return warmup_report
+
+    warmup_report.update({
+        "source": "shard map",
+        "tiles": len(shard_map),
+        "snapshot_version": shard_map.version,
+        "seconds": round(time.perf_counter() - started, 3),
+        "max_rss_mb_before": rss_before,
+        "max_rss_mb_after": _max_rss_mb(),
+    })
+
+    logger.info(
+        "Route warm-up: shard map of %(tiles)d station tiles in %(seconds).3fs",
+        warmup_report
+    )
+
+    return warmup_report
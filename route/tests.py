@@ -1,3 +1,1421 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from datetime import datetime, time as clock, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from route.benchmarks import memory, startup
+from route.models import FuelStation, FuelStop, RouteGeometry, RouteRequest
+from route.renderers import columnar_stops, delta_encode_polyline
+from route.services import geo, parallel_projection, warmup
+from route.services.coalescing import SingleFlight
+from route.services.lane_service import LaneService
+from route.services.ors_service import ORSService
+from route.services.optimization_service import RouteOptimizationService
+from route.services.plan_cache import ProjectionCache, get_plan_cache, get_projection_cache
+from route.services.planning_service import RoutePlanningService
+from route.services.rate_limiter import BACKGROUND, INTERACTIVE, RateLimitTimeout, TokenBucketScheduler
+from route.services.retention_service import RetentionService
+from route.services.resilience import CircuitBreaker, ResilientClient, UpstreamUnavailable
+from route.services.station_shards import StationShardMap
+from route.services.station_snapshot import StationSnapshot, get_attribute_mask
+
+
+def create_station(pk, latitude, longitude, price="3.000", **fields):
+    return FuelStation.objects.create(
+        id=pk,
+        opis_id=pk,
+        name=f"STATION #{pk}",
+        address="",
+        city="Somewhere",
+        state=fields.pop("state", "TX"),
+        retail_price=Decimal(price),
+        latitude=latitude,
+        longitude=longitude,
+        is_geocoded=True,
+        **fields
+    )
+
+
+class StartupBudgetTests(SimpleTestCase):
+
+    def test_startup_stays_within_import_budget(self):
+        for scenario in startup.BUDGET_MS:
+            with self.subTest(scenario=scenario):
+                report = startup.measure(scenario)
+
+                self.assertLessEqual(report["import_ms"], report["budget_ms"])
+                self.assertEqual(report["heavy_modules"], [])
+
+
+class MemoryBudgetTests(SimpleTestCase):
+
+    def test_long_route_stays_within_memory_budget(self):
+        # One fixture keeps the suite fast; the benchmark covers them all
+        routes = memory.load_routes()
+        route = next(route for route in routes if route["name"].startswith("I-10 "))
+        snapshot = memory.synthetic_snapshot(routes)
+
+        bounded = memory.measure(route, snapshot, settings.ROUTE_CANDIDATES_PER_POINT)
+        unbounded = memory.measure(route, snapshot, None)
+
+        self.assertGreater(bounded["stops"], 0)
+        self.assertEqual(bounded["stops"], unbounded["stops"])
+        self.assertLessEqual(bounded["peak_mb"], settings.ROUTE_MEMORY_BUDGET_MB)
+
+        # Fails if the per-point bound stops applying
+        self.assertLess(bounded["candidates"], unbounded["candidates"])
+        self.assertLess(bounded["peak_mb"], unbounded["peak_mb"] * 0.8)
+
+
+def straight_route(start=(32.0, -100.0), end=(32.0, -97.0), steps=300):
+    """
+    Route data as returned by ORSService.get_route for a straight line.
+    """
+    import polyline
+
+    points = [
+        (
+            round(start[0] + (end[0] - start[0]) * step / steps, 5),
+            round(start[1] + (end[1] - start[1]) * step / steps, 5),
+        )
+        for step in range(steps + 1)
+    ]
+    distance = RouteOptimizationService.get_cumulative_distances(points)[-1]
+    encoded = polyline.encode(points)
+
+    return {
+        "distance_miles": distance,
+        "duration_seconds": distance * 60,
+        "legs": [{"distance_miles": distance, "duration_seconds": distance * 60}],
+        "polyline": encoded,
+        "decoded_points": polyline.decode(encoded),
+    }
+
+
+@override_settings(STATION_SNAPSHOT_PATH=Path("/nonexistent/station_snapshot.pickle"))
+class WarmUpTests(TestCase):
+
+    def setUp(self):
+        create_station(1, 32.78, -96.80)
+        create_station(2, 33.45, -112.07)
+
+        StationSnapshot.invalidate()
+        StationShardMap.invalidate()
+        warmup.warmup_report.clear()
+
+        self.addCleanup(StationSnapshot.invalidate)
+        self.addCleanup(StationShardMap.invalidate)
+        self.addCleanup(warmup.warmup_report.clear)
+
+    def test_installs_snapshot(self):
+        with self.assertLogs("route.services.warmup", "INFO"):
+            report = warmup.warm_up()
+
+        self.assertIsNotNone(StationSnapshot._current)
+        self.assertEqual(len(StationSnapshot._current), 2)
+        self.assertEqual(report["source"], "database")
+        self.assertEqual(report["stations"], 2)
+        self.assertIs(report, warmup.warmup_report)
+
+    @override_settings(ROUTE_STATION_SHARDING=True)
+    def test_loads_shard_map_when_sharding(self):
+        with self.assertLogs("route.services.warmup", "INFO"):
+            report = warmup.warm_up()
+
+        self.assertIsNone(StationSnapshot._current)
+        self.assertIsNotNone(StationShardMap._current)
+        self.assertEqual(report["source"], "shard map")
+        self.assertEqual(report["tiles"], 2)
+        self.assertEqual(report["snapshot_version"], StationShardMap._current.version)
+
+
+class LaneRepricingTests(TestCase):
+
+    def setUp(self):
+        # Three stations at the same spot, ~88 miles along the route
+        for pk, price in ((1, "3.000"), (2, "3.100"), (3, "3.200")):
+            create_station(pk, 32.01, -98.5, price)
+
+        StationSnapshot.invalidate()
+        self.addCleanup(StationSnapshot.invalidate)
+
+    def plan_stop(self, projected):
+        stops, _, _, _ = RouteOptimizationService.calculate_realistic_stops(
+            self.route["distance_miles"], 10, 10, 10, projected_stations=projected
+        )
+        return stops[0]["station_name"]
+
+    @override_settings(ROUTE_CANDIDATES_PER_POINT=1)
+    def test_lane_picks_up_price_drop_of_station_outside_the_bound(self):
+        self.route = straight_route()
+        route_hash = RouteRequest.build_route_hash("A", "B")
+
+        with mock.patch("route.services.ors_service.ORSService.get_route", return_value=self.route):
+            LaneService.precompute_lane(route_hash, "A", "B")
+
+        _, projected = LaneService.load_lane(route_hash)
+        self.assertEqual(self.plan_stop(projected), "STATION #1")
+
+        FuelStation.objects.filter(pk=3).update(retail_price=Decimal("1.000"))
+        StationSnapshot.invalidate()
+
+        _, projected = LaneService.load_lane(route_hash)
+        fresh = RouteOptimizationService.get_projected_stations(self.route["decoded_points"])
+
+        self.assertEqual(self.plan_stop(projected), "STATION #3")
+        self.assertEqual(self.plan_stop(fresh), "STATION #3")
+
+
+class CandidateBoundTests(TestCase):
+
+    def setUp(self):
+        # Three stations at the same spot, ~88 miles (~88 minutes) along the route
+        create_station(1, 32.01, -98.5, "3.000", opens_at=clock(18), closes_at=clock(22))
+        create_station(2, 32.01, -98.5, "3.100", opens_at=clock(6), closes_at=clock(22))
+        create_station(3, 32.01, -98.5, "3.200", opens_at=clock(6), closes_at=clock(22))
+
+        StationSnapshot.invalidate()
+        self.addCleanup(StationSnapshot.invalidate)
+
+    @override_settings(ROUTE_CANDIDATES_PER_POINT=1)
+    def test_bound_keeps_a_station_open_on_arrival(self):
+        route = straight_route()
+        projected = RouteOptimizationService.get_projected_stations(route["decoded_points"])
+
+        # 09:00 CDT departure: the cheapest station only opens in the evening
+        eta_at = RouteOptimizationService.build_eta(
+            route["legs"], datetime(2026, 10, 19, 14, tzinfo=timezone.utc)
+        )
+        stops, _, _, _ = RouteOptimizationService.calculate_realistic_stops(
+            route["distance_miles"], 10, 10, 10, projected_stations=projected, eta_at=eta_at
+        )
+
+        self.assertEqual(stops[0]["station_name"], "STATION #2")
+        # Same hours and attributes as #2, so the bound still drops it
+        self.assertNotIn(3, {station.pk for _, _, station in projected})
+
+
+class StationVersionTests(TestCase):
+
+    def setUp(self):
+        create_station(1, 32.0, -97.0, "3.000", opens_at=clock(6), closes_at=clock(22))
+        create_station(2, 33.0, -98.0, "3.500", opens_at=clock(8), closes_at=clock(23))
+        self.version = StationSnapshot.get_version()
+
+    def assertVersionChanges(self):
+        version = StationSnapshot.get_version()
+        self.assertNotEqual(version, self.version)
+        self.version = version
+
+    def test_hours_edit_on_any_station(self):
+        FuelStation.objects.filter(pk=1).update(opens_at=clock(7), closes_at=clock(12))
+        self.assertVersionChanges()
+
+    def test_truck_access_swap(self):
+        FuelStation.objects.filter(pk=1).update(truck_accessible=False)
+        self.assertVersionChanges()
+
+        FuelStation.objects.filter(pk=1).update(truck_accessible=True)
+        FuelStation.objects.filter(pk=2).update(truck_accessible=False)
+        self.assertVersionChanges()
+
+    def test_price_swap(self):
+        FuelStation.objects.filter(pk=1).update(retail_price=Decimal("3.500"))
+        FuelStation.objects.filter(pk=2).update(retail_price=Decimal("3.000"))
+        self.assertVersionChanges()
+
+    def test_rename(self):
+        station = FuelStation.objects.get(pk=2)
+        station.name = "RENAMED"
+        station.save()
+        self.assertVersionChanges()
+
+
+class OpeningHoursTests(SimpleTestCase):
+
+    def station(self, state, opens_at, closes_at):
+        station = FuelStation(state=state, opens_at=opens_at, closes_at=closes_at)
+        station.attribute_mask = get_attribute_mask(station)
+        return station
+
+    def test_hours_are_local_to_the_station(self):
+        texas = self.station("TX", clock(6), clock(22))
+
+        # 22:00 and 09:00 CDT
+        self.assertFalse(RouteOptimizationService.is_open_at(texas, datetime(2026, 10, 19, 3, tzinfo=timezone.utc)))
+        self.assertTrue(RouteOptimizationService.is_open_at(texas, datetime(2026, 10, 19, 14, tzinfo=timezone.utc)))
+
+    def test_arizona_does_not_observe_daylight_saving(self):
+        arizona = self.station("AZ", clock(6), clock(22))
+
+        # 21:30 MST in Arizona, 22:30 MDT in Colorado
+        when = datetime(2026, 7, 1, 4, 30, tzinfo=timezone.utc)
+        self.assertTrue(RouteOptimizationService.is_open_at(arizona, when))
+        self.assertFalse(RouteOptimizationService.is_open_at(self.station("CO", clock(6), clock(22)), when))
+
+    def test_overnight_hours(self):
+        station = self.station("CA", clock(18), clock(6))
+
+        # 20:00 and 12:00 PDT
+        self.assertTrue(RouteOptimizationService.is_open_at(station, datetime(2026, 10, 19, 3, tzinfo=timezone.utc)))
+        self.assertFalse(RouteOptimizationService.is_open_at(station, datetime(2026, 10, 19, 19, tzinfo=timezone.utc)))
+
+    def test_equal_times_mean_open_all_day(self):
+        station = self.station("TX", clock(0), clock(0))
+
+        for hour in (0, 6, 12, 23):
+            self.assertTrue(RouteOptimizationService.is_open_at(station, datetime(2026, 10, 19, hour, tzinfo=timezone.utc)))
+
+
+class QuantizeVehicleTests(SimpleTestCase):
+
+    def test_rounds_down(self):
+        self.assertEqual(RoutePlanningService.quantize_vehicle(9.76, 23, 23), (9.75, 22.5, 22.5))
+        self.assertEqual(RoutePlanningService.quantize_vehicle(10.4, 50, 37.5), (10.25, 47.5, 37.5))
+
+        for value in (0.3, 9.74, 9.75, 9.9, 10.0, 10.24, 57.1):
+            with self.subTest(value=value):
+                self.assertLessEqual(RoutePlanningService._quantize(value, 0.5), value)
+
+    def test_near_identical_profiles_share_a_bucket(self):
+        self.assertEqual(
+            RoutePlanningService.quantize_vehicle(9.9, 50, 50),
+            RoutePlanningService.quantize_vehicle(10.0, 51, 49)
+        )
+
+    def test_values_under_the_lowest_bucket_are_kept(self):
+        self.assertEqual(RoutePlanningService.quantize_vehicle(0.2, 2, 1), (0.2, 2.0, 1.0))
+
+
+class ProjectionCacheTests(SimpleTestCase):
+
+    def projection(self, count):
+        station = FuelStation(id=1)
+        return {"distance_miles": 100.0, "polyline": "x" * 100}, [(float(mile), 0.5, station) for mile in range(count)]
+
+    def test_bounded_by_bytes(self):
+        value = self.projection(1000)
+        size = ProjectionCache.get_size(value)
+        cache = ProjectionCache(int(size * 2.5))
+
+        for key in range(3):
+            cache.set(key, self.projection(1000))
+
+        self.assertIsNone(cache.get(0))
+        self.assertIsNotNone(cache.get(2))
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertLessEqual(cache.stats()["bytes"], cache.max_bytes)
+
+    def test_size_grows_with_projection(self):
+        self.assertGreater(
+            ProjectionCache.get_size(self.projection(10000)),
+            10000 * 64
+        )
+
+    def test_oversized_entry_is_not_cached(self):
+        cache = ProjectionCache(1024)
+        cache.set("route", self.projection(1000))
+
+        self.assertIsNone(cache.get("route"))
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+
+class ProjectionPoolTests(TestCase):
+
+    def tearDown(self):
+        parallel_projection.shutdown_projection_pool()
+
+    def snapshot(self, version):
+        stations = [FuelStation(id=1, retail_price=Decimal("3.000"), latitude=32.0, longitude=-98.0)]
+        return StationSnapshot(stations, version=version)
+
+    def test_replaced_pool_stays_usable_until_released(self):
+        with parallel_projection.use_projection_pool(self.snapshot("a"), 2) as old_pool:
+            # Another request sees a new station version meanwhile
+            with parallel_projection.use_projection_pool(self.snapshot("b"), 2) as new_pool:
+                self.assertIsNot(new_pool, old_pool)
+
+            matches = old_pool.project([(32.0, -98.0)], [0.0], 10)
+            self.assertEqual(matches, [(0.0, 0.0, 0)])
+            self.assertFalse(old_pool.acquire())
+
+        self.assertTrue(old_pool._executor._shutdown_thread)
+        self.assertFalse(new_pool._executor._shutdown_thread)
+
+    @override_settings(ROUTE_PROJECTION_WORKERS=2, ROUTE_PROJECTION_PARALLEL_THRESHOLD=0)
+    def test_shut_down_pool_falls_back_in_process(self):
+        create_station(1, 32.0, -98.0)
+        StationSnapshot.invalidate()
+        route_points = straight_route()["decoded_points"]
+        candidates = StationSnapshot.current()
+
+        error = RuntimeError("cannot schedule new futures after shutdown")
+        with mock.patch.object(parallel_projection.ProjectionPool, "project", side_effect=error):
+            projected = RouteOptimizationService.project_stations(route_points, candidates)
+
+        self.assertEqual({station.pk for _, _, station in projected}, {1})
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def run_concurrently(self, flight, fn, callers=5):
+        """
+        Call ``flight.do`` from ``callers`` threads while the leader is
+        blocked in ``fn``; return each caller's result or exception.
+        """
+        started = threading.Event()
+        release = threading.Event()
+        outcomes = [None] * callers
+
+        def leader_fn():
+            started.set()
+            release.wait(5)
+            return fn()
+
+        def call(position):
+            try:
+                outcomes[position] = flight.do("route", leader_fn)
+            except Exception as e:
+                outcomes[position] = e
+
+        threads = [threading.Thread(target=call, args=(position,)) for position in range(callers)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+
+        # Count followers as they start waiting on the in-flight call
+        event = flight._calls["route"].event
+        waiting = threading.Semaphore(0)
+        event_wait = event.wait
+
+        def counted_wait(timeout=None):
+            waiting.release()
+            return event_wait(timeout)
+
+        event.wait = counted_wait
+
+        for thread in threads[1:]:
+            thread.start()
+        for _ in threads[1:]:
+            self.assertTrue(waiting.acquire(timeout=5))
+
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        return outcomes
+
+    def test_followers_share_the_leaders_result(self):
+        flight = SingleFlight()
+        calls = []
+
+        outcomes = self.run_concurrently(flight, lambda: calls.append(1) or {"stops": 3})
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [{"stops": 3}] * 5)
+        self.assertEqual(flight._calls, {})
+
+    def test_followers_share_the_leaders_exception(self):
+        flight = SingleFlight()
+        error = ValueError("route not found")
+
+        def fail():
+            raise error
+
+        outcomes = self.run_concurrently(flight, fail)
+
+        self.assertTrue(all(outcome is error for outcome in outcomes))
+
+        # The failure is not cached: the next call computes again
+        self.assertEqual(flight.do("route", lambda: "fresh"), "fresh")
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("route.services.resilience.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_opens_goes_half_open_and_closes(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        self.now += 30
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+        # One trial call at a time
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.failures, 0)
+        self.assertTrue(breaker.allow_request())
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+
+        self.now += 30
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.now += 29
+        self.assertFalse(breaker.allow_request())
+
+    def test_unexpected_error_during_trial_releases_it(self):
+        import sqlite3
+
+        client = ResilientClient("osrm", failure_threshold=1, reset_timeout=30, retries=0)
+        client.breaker.record_failure()
+        self.now += 30
+
+        with mock.patch.object(client, "_send", side_effect=sqlite3.OperationalError("database is locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                client.get("http://osrm.test/route")
+
+        ok = mock.Mock(status_code=200)
+        with mock.patch("requests.get", return_value=ok):
+            self.assertIs(client.get("http://osrm.test/route"), ok)
+
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_client_fails_fast_while_open(self):
+        import requests
+
+        client = ResilientClient("osrm", failure_threshold=2, reset_timeout=30, retries=0)
+        ok = mock.Mock(status_code=200)
+
+        with mock.patch("requests.get", side_effect=requests.exceptions.ConnectionError("down")) as get:
+            for _ in range(2):
+                with self.assertRaises(UpstreamUnavailable):
+                    client.get("http://osrm.test/route")
+
+            with self.assertRaisesMessage(UpstreamUnavailable, "circuit open"):
+                client.get("http://osrm.test/route")
+
+            self.assertEqual(get.call_count, 2)
+
+        self.now += 30
+        with mock.patch("requests.get", return_value=ok):
+            self.assertIs(client.get("http://osrm.test/route"), ok)
+
+        self.assertEqual(client.status()["state"], CircuitBreaker.CLOSED)
+
+
+class TokenBucketSchedulerTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "rate_limit.sqlite3"
+
+    def wait_for_queue(self, scheduler, interactive, background):
+        for _ in range(200):
+            if scheduler.queue_depth() == {"interactive": interactive, "background": background}:
+                return
+            time.sleep(0.01)
+        self.fail(f"queue never reached {interactive} interactive / {background} background")
+
+    def test_interactive_caller_is_granted_before_queued_background_one(self):
+        scheduler = TokenBucketScheduler(self.path, "nominatim", rate=1, burst=1)
+        scheduler.acquire(INTERACTIVE)
+
+        granted = []
+
+        def acquire(priority, label):
+            # A separate scheduler, as another worker process would have
+            TokenBucketScheduler(self.path, "nominatim", rate=1, burst=1).acquire(priority)
+            granted.append(label)
+
+        background = threading.Thread(target=acquire, args=(BACKGROUND, "background"))
+        background.start()
+        self.wait_for_queue(scheduler, interactive=0, background=1)
+
+        interactive = threading.Thread(target=acquire, args=(INTERACTIVE, "interactive"))
+        interactive.start()
+
+        background.join(10)
+        interactive.join(10)
+
+        self.assertEqual(granted, ["interactive", "background"])
+        self.assertEqual(scheduler.queue_depth(), {"interactive": 0, "background": 0})
+
+    def test_interactive_caller_gives_up_after_max_wait(self):
+        scheduler = TokenBucketScheduler(self.path, "nominatim", rate=0.1, burst=1)
+        scheduler.acquire(INTERACTIVE)
+
+        with self.assertRaises(RateLimitTimeout):
+            scheduler.acquire(INTERACTIVE, max_wait=0.2)
+
+        # The abandoned waiter leaves the queue
+        self.assertEqual(scheduler.queue_depth(), {"interactive": 0, "background": 0})
+
+
+class RetentionTests(TestCase):
+
+    def create_request(self, start, end, polyline, created_at=None):
+        request = RouteRequest.objects.create(
+            start_location=start,
+            end_location=end,
+            route_hash=RouteRequest.build_route_hash(start, end),
+            total_distance_miles=100.0,
+            total_fuel_cost=Decimal("35.00"),
+            route_polyline=polyline,
+        )
+
+        if created_at is not None:
+            RouteRequest.objects.filter(pk=request.pk).update(created_at=created_at)
+
+        return request
+
+    def test_compact_polylines_round_trips(self):
+        first = self.create_request("Dallas, TX", "Austin, TX", "_p~iF~ps|U_ulLnnqC")
+        repeat = self.create_request("Dallas, TX", "Austin, TX", "_p~iF~ps|U_ulLnnqC")
+        other = self.create_request("Dallas, TX", "Houston, TX", "_mqNvxq`@")
+
+        self.assertEqual(RetentionService.compact_polylines(batch_size=2), (3, 2))
+
+        for request, polyline in ((first, "_p~iF~ps|U_ulLnnqC"), (repeat, "_p~iF~ps|U_ulLnnqC"), (other, "_mqNvxq`@")):
+            request.refresh_from_db()
+            self.assertEqual(request.route_polyline, "")
+            self.assertEqual(request.get_route_polyline(), polyline)
+
+        first.refresh_from_db()
+        repeat.refresh_from_db()
+        self.assertEqual(first.geometry_id, repeat.geometry_id)
+
+        # Nothing left to compact; every geometry is still in use
+        self.assertEqual(RetentionService.compact_polylines(), (0, 0))
+        self.assertEqual(RetentionService.prune_unused_geometries(), 0)
+
+        other.delete()
+        self.assertEqual(RetentionService.prune_unused_geometries(), 1)
+        self.assertEqual(RouteGeometry.objects.count(), 1)
+
+    def test_same_polyline_on_another_route_gets_its_own_geometry(self):
+        self.create_request("Dallas, TX", "Austin, TX", "_p~iF~ps|U")
+        self.create_request("Dallas, TX", "Waco, TX", "_p~iF~ps|U")
+
+        self.assertEqual(RetentionService.compact_polylines(), (2, 2))
+
+    def test_prune_unused_geometries_in_batches_without_loading_polylines(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        geometries = [
+            RouteGeometry.objects.create(
+                route_hash="a" * 64, polyline_hash=str(number) * 64,
+                polyline_compressed=RouteGeometry.compress("_p~iF~ps|U"), polyline_length=10
+            )
+            for number in range(3)
+        ]
+        request = self.create_request("Dallas, TX", "Austin, TX", "")
+        RouteRequest.objects.filter(pk=request.pk).update(geometry=geometries[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(RetentionService.prune_unused_geometries(batch_size=1), 2)
+
+        self.assertEqual(RouteGeometry.objects.count(), 1)
+        self.assertEqual(sum(query["sql"].startswith("DELETE") for query in queries), 2)
+        self.assertFalse(any("polyline_compressed" in query["sql"] for query in queries))
+
+    def test_prune_fuel_stops_summarises(self):
+        station = create_station(1, 32.0, -97.0)
+        now = datetime(2026, 10, 19, tzinfo=timezone.utc)
+        old = now - timedelta(days=200)
+
+        with_stops = self.create_request("Dallas, TX", "Austin, TX", "", created_at=old)
+        without_stops = self.create_request("Dallas, TX", "Houston, TX", "", created_at=old)
+        recent = self.create_request("Dallas, TX", "El Paso, TX", "", created_at=now)
+
+        for plan, stops in ((with_stops, [(30.5, "100.10"), (20.25, "60.55")]), (recent, [(40.0, "120.00")])):
+            for order, (gallons, cost) in enumerate(stops, start=1):
+                FuelStop.objects.create(
+                    route=plan, station=station, stop_order=order, miles_from_start=order * 100.0,
+                    gallons_filled=gallons, cost=Decimal(cost)
+                )
+
+        summarized, deleted = RetentionService.prune_fuel_stops(now - timedelta(days=180), batch_size=1)
+
+        self.assertEqual((summarized, deleted), (2, 2))
+
+        with_stops.refresh_from_db()
+        without_stops.refresh_from_db()
+        recent.refresh_from_db()
+
+        self.assertEqual(with_stops.fuel_stop_summary, {"stops": 2, "gallons_filled": 50.75, "cost": 160.65})
+        self.assertEqual(without_stops.fuel_stop_summary, {"stops": 0, "gallons_filled": 0.0, "cost": 0.0})
+        self.assertIsNone(recent.fuel_stop_summary)
+        self.assertEqual(list(FuelStop.objects.values_list("route_id", flat=True)), [recent.pk])
+
+        # Already summarised plans are skipped
+        self.assertEqual(RetentionService.prune_fuel_stops(now - timedelta(days=180)), (0, 0))
+
+
+class ReplanTests(TestCase):
+
+    def setUp(self):
+        # Along a ~176 mile route, cheapest near the middle
+        for pk, longitude, price in ((1, -99.5, "3.400"), (2, -98.5, "3.000"), (3, -97.5, "3.200")):
+            create_station(pk, 32.01, longitude, price)
+
+        StationSnapshot.invalidate()
+        get_plan_cache().clear()
+        get_projection_cache().clear()
+
+        self.addCleanup(StationSnapshot.invalidate)
+        self.addCleanup(get_plan_cache().clear)
+        self.addCleanup(get_projection_cache().clear)
+
+    def test_replan_reuses_the_projection(self):
+        trip = {"start_location": "Abilene, TX", "end_location": "Fort Worth, TX", "vehicle_mpg": 10, "tank_capacity": 10}
+
+        with mock.patch("route.services.ors_service.ORSService.get_route", return_value=straight_route()) as get_route:
+            plan = self.client.post("/api/optimize-route/", {**trip, "initial_fuel": 10}, content_type="application/json")
+            self.assertEqual(plan.status_code, 200)
+
+            replan = self.client.post(
+                "/api/replan-route/",
+                {**trip, "current_mile": 50, "current_fuel": 3},
+                content_type="application/json"
+            )
+
+        self.assertEqual(replan.status_code, 200)
+        self.assertEqual(get_route.call_count, 1)
+
+        result = replan.json()
+        self.assertEqual(result["replanned_from_mile"], 50)
+        self.assertEqual(result["total_distance_miles"], plan.json()["total_distance_miles"])
+        self.assertGreater(result["total_stops"], 0)
+        self.assertTrue(all(stop["miles_from_start"] > 50 for stop in result["fuel_stops"]))
+
+    def test_replan_after_a_station_edit_reprojects_without_routing(self):
+        trip = {"start_location": "Abilene, TX", "end_location": "Fort Worth, TX", "vehicle_mpg": 10, "tank_capacity": 10}
+        replan_body = {**trip, "current_mile": 60, "current_fuel": 10}
+
+        with mock.patch("route.services.ors_service.ORSService.get_route", return_value=straight_route()) as get_route:
+            self.client.post("/api/optimize-route/", {**trip, "initial_fuel": 10}, content_type="application/json")
+
+            FuelStation.objects.filter(pk=3).update(retail_price=Decimal("2.000"))
+            StationSnapshot.invalidate()
+
+            replan = self.client.post("/api/replan-route/", replan_body, content_type="application/json")
+            self.assertEqual(get_route.call_count, 1)
+
+            # Same plan as from a cold start
+            get_plan_cache().clear()
+            get_projection_cache().clear()
+            cold = self.client.post("/api/replan-route/", replan_body, content_type="application/json")
+
+        self.assertEqual(replan.status_code, 200)
+        self.assertIn("STATION #3", [stop["station_name"] for stop in replan.json()["fuel_stops"]])
+        self.assertEqual(replan.json(), cold.json())
+
+    def test_near_identical_approximate_requests_share_a_plan(self):
+        trip = {"start_location": "Abilene, TX", "end_location": "Fort Worth, TX", "allow_approximate": True}
+        plan_cache = get_plan_cache()
+
+        with mock.patch("route.services.ors_service.ORSService.get_route", return_value=straight_route()):
+            first = self.client.post(
+                "/api/optimize-route/", {**trip, "vehicle_mpg": 9.9, "tank_capacity": 10, "initial_fuel": 10},
+                content_type="application/json"
+            ).json()
+            hits = plan_cache.hits
+            second = self.client.post(
+                "/api/optimize-route/", {**trip, "vehicle_mpg": 10.0, "tank_capacity": 10, "initial_fuel": 10},
+                content_type="application/json"
+            ).json()
+
+        self.assertEqual(plan_cache.hits, hits + 1)
+        self.assertEqual(second, first)
+        self.assertTrue(first["approximate"])
+        self.assertEqual((first["vehicle_mpg"], first["tank_capacity"], first["initial_fuel"]), (9.75, 7.5, 7.5))
+
+    def test_alternatives_are_the_next_cheapest_in_reach(self):
+        # Two more stations beside the cheapest one
+        create_station(4, 32.01, -98.5, "3.050")
+        create_station(5, 32.01, -98.5, "3.150")
+        StationSnapshot.invalidate()
+
+        projected = RouteOptimizationService.get_projected_stations(straight_route()["decoded_points"])
+        stops, _, _, _ = RouteOptimizationService.calculate_realistic_stops(
+            176, 10, 10, 10, projected_stations=projected, alternatives=2
+        )
+
+        stop = stops[0]
+        self.assertEqual(stop["station_name"], "STATION #2")
+        self.assertEqual(
+            [alternative["station_name"] for alternative in stop["alternatives"]],
+            ["STATION #4", "STATION #5"]
+        )
+
+        first = stop["alternatives"][0]
+        self.assertAlmostEqual(first["price_delta_per_gallon"], 0.05)
+        self.assertAlmostEqual(first["cost_delta"], round(0.05 * stop["gallons_refilled"], 2))
+
+
+class RouteHashTests(SimpleTestCase):
+
+    def test_two_location_format_is_unchanged(self):
+        import hashlib
+
+        self.assertEqual(
+            RouteRequest.build_route_hash(" Dallas, TX", "Austin, TX "),
+            hashlib.sha256(b"dallas, tx-austin, tx").hexdigest()
+        )
+
+    def test_waypoints_are_unambiguous(self):
+        self.assertNotEqual(
+            RouteRequest.build_route_hash("Winston-Salem, NC", "Raleigh, NC", ["Durham, NC"]),
+            RouteRequest.build_route_hash("Winston", "Raleigh, NC", ["Salem, NC", "Durham, NC"])
+        )
+
+        # Joined with "-" both would be "a-c-b"
+        self.assertNotEqual(
+            RouteRequest.build_route_hash("A", "B", ["C"]),
+            RouteRequest.build_route_hash("A", "C-B")
+        )
+
+
+class RouteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        route = straight_route()
+        osrm_response = mock.Mock(status_code=200)
+        osrm_response.json.return_value = {"routes": [{
+            "distance": route["distance_miles"] / ORSService.METERS_TO_MILES,
+            "duration": route["duration_seconds"],
+            "geometry": route["polyline"],
+            "legs": [{"distance": route["distance_miles"] / ORSService.METERS_TO_MILES, "duration": route["duration_seconds"]}],
+        }]}
+
+        self.client_get = mock.Mock(return_value=osrm_response)
+        patches = [
+            mock.patch.object(ORSService, "geocode_locations", return_value=[(32.0, -100.0), (32.0, -97.0)]),
+            mock.patch("route.services.ors_service.get_client", return_value=mock.Mock(get=self.client_get)),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cached_route_is_served_without_calling_osrm(self):
+        first = ORSService.get_route("Abilene, TX", "Fort Worth, TX")
+        second = ORSService.get_route("abilene, tx", "Fort Worth, TX")
+
+        self.assertEqual(self.client_get.call_count, 1)
+        self.assertEqual(second, first)
+        self.assertNotIn("cached_at", second)
+
+    def test_expired_route_is_refetched_but_served_while_osrm_is_down(self):
+        ORSService.get_route("Abilene, TX", "Fort Worth, TX")
+
+        expired = time.time() + ORSService.ROUTE_CACHE_TTL + 1
+        with mock.patch("route.services.ors_service.time.time", return_value=expired):
+            ORSService.get_route("Abilene, TX", "Fort Worth, TX")
+            self.assertEqual(self.client_get.call_count, 2)
+
+            self.client_get.side_effect = UpstreamUnavailable("osrm", "circuit open")
+            route = ORSService.get_route("Abilene, TX", "Fort Worth, TX")
+
+        self.assertEqual(route["polyline"], straight_route()["polyline"])
+
+
+class RouteRequestAdminTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+    def test_change_form_does_not_load_geometries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        geometry = RouteGeometry.objects.create(
+            route_hash="a" * 64, polyline_hash="b" * 64,
+            polyline_compressed=RouteGeometry.compress("_p~iF~ps|U"), polyline_length=10
+        )
+        request = RouteRequest.objects.create(
+            start_location="Dallas, TX", end_location="Austin, TX", total_distance_miles=195.0,
+            total_fuel_cost=Decimal("60.00"), geometry=geometry
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/admin/route/routerequest/{request.pk}/change/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, '<select name="geometry"')
+
+        # Only the linked geometry is read, for the raw id widget's label
+        geometry_queries = [query["sql"] for query in queries if "route_routegeometry" in query["sql"]]
+        self.assertEqual(len(geometry_queries), 1)
+        self.assertIn(f'WHERE "route_routegeometry"."id" = {geometry.pk}', geometry_queries[0])
+
+
+class AdminChangelistTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+        station = create_station(1, 32.0, -97.0)
+        for number in range(3):
+            request = RouteRequest.objects.create(
+                start_location="Dallas, TX", end_location=f"Town {number}, TX", total_distance_miles=100.0,
+                total_fuel_cost=Decimal("30.00"), route_polyline="_p~iF~ps|U"
+            )
+            FuelStop.objects.create(
+                route=request, station=station, stop_order=1, miles_from_start=50.0,
+                gallons_filled=10.0, cost=Decimal("30.00")
+            )
+
+    def get_changelist(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in queries]
+
+    def test_changelists_count_a_bounded_number_of_rows(self):
+        for url in ("/admin/route/fuelstation/", "/admin/route/routerequest/", "/admin/route/fuelstop/"):
+            with self.subTest(url=url):
+                counts = [sql for sql in self.get_changelist(url) if "COUNT(" in sql]
+
+                self.assertEqual(len(counts), 1)
+                self.assertIn("LIMIT 1101", counts[0])
+
+    def test_changelists_do_not_load_route_polylines(self):
+        for url in ("/admin/route/routerequest/", "/admin/route/fuelstop/"):
+            with self.subTest(url=url):
+                self.assertFalse(any("route_polyline" in sql for sql in self.get_changelist(url)))
+
+    def test_bounded_count(self):
+        from route.admin import BoundedCountPaginator
+
+        paginator = BoundedCountPaginator(FuelStop.objects.order_by("id"), 1, count_limit=2)
+
+        self.assertEqual(paginator.count, 2)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(BoundedCountPaginator(FuelStop.objects.order_by("id"), 1).count, 3)
+
+
+class ListAPITests(TestCase):
+
+    def setUp(self):
+        create_station(1, 32.0, -97.0, "3.100")
+        create_station(2, 32.0, -97.0, "3.600")
+        create_station(3, 33.4, -112.0, "3.200", state="AZ")
+        create_station(4, 32.0, -97.0, "3.300")
+        create_station(5, 32.0, -97.0, "3.400")
+        FuelStation.objects.filter(pk=5).update(is_geocoded=False)
+
+    def get_pages(self, url, queries_per_page):
+        """
+        Follow the ``next`` links from ``url``; returns every page's results.
+        """
+        pages = []
+
+        while url:
+            with self.assertNumQueries(queries_per_page):
+                response = self.client.get(url)
+
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json()["results"])
+            url = response.json()["next"]
+
+        return pages
+
+    def test_station_filters(self):
+        response = self.client.get("/api/stations/", {
+            "state": "texas", "is_geocoded": "true", "min_price": "3.000", "max_price": "3.500"
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([station["id"] for station in response.json()["results"]], [1, 4])
+
+        response = self.client.get("/api/stations/", {"state": " az "})
+        self.assertEqual([station["id"] for station in response.json()["results"]], [3])
+
+    def test_invalid_station_filters(self):
+        for params in ({"state": "Atlantis"}, {"min_price": "cheap"}, {"is_geocoded": "maybe"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/api/stations/", params).status_code, 400)
+
+    def test_station_cursor_paging(self):
+        pages = self.get_pages("/api/stations/?page_size=2", queries_per_page=1)
+
+        self.assertEqual([[station["id"] for station in page] for page in pages], [[1, 2], [3, 4], [5]])
+
+    def test_plans_newest_first_with_stops_in_two_queries_per_page(self):
+        station = FuelStation.objects.get(pk=1)
+        plans = []
+
+        for number in range(3):
+            plan = RouteRequest.objects.create(
+                start_location="Dallas, TX", end_location=f"Town {number}, TX",
+                route_hash=RouteRequest.build_route_hash("Dallas, TX", f"Town {number}, TX"),
+                total_distance_miles=100.0, total_fuel_cost=Decimal("30.00")
+            )
+            for order in (1, 2):
+                FuelStop.objects.create(
+                    route=plan, station=station, stop_order=order, miles_from_start=order * 40.0,
+                    gallons_filled=5.0, cost=Decimal("15.50")
+                )
+            plans.append(plan)
+
+        pages = self.get_pages("/api/plans/?page_size=2", queries_per_page=2)
+
+        self.assertEqual([[plan["id"] for plan in page] for page in pages], [[plans[2].pk, plans[1].pk], [plans[0].pk]])
+        self.assertEqual(len(pages[0][0]["fuel_stops"]), 2)
+
+        response = self.client.get("/api/plans/", {"route_hash": plans[1].route_hash})
+        self.assertEqual([plan["id"] for plan in response.json()["results"]], [plans[1].pk])
+
+
+def decode_route_points(packed):
+    """
+    Inverse of delta_encode_polyline: zigzag varints back to coordinates.
+    """
+    values = []
+    value = shift = 0
+
+    for byte in packed:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            values.append((value >> 1) ^ -(value & 1))
+            value = shift = 0
+
+    points = []
+    lat = lon = 0
+    for position in range(0, len(values), 2):
+        lat += values[position]
+        lon += values[position + 1]
+        points.append((lat / 1e5, lon / 1e5))
+
+    return points
+
+
+class MessagePackRendererTests(TestCase):
+
+    PLAN = {
+        "start_location": "Abilene, TX", "end_location": "Fort Worth, TX",
+        "vehicle_mpg": 10, "tank_capacity": 10, "initial_fuel": 10,
+    }
+
+    def setUp(self):
+        for pk, longitude, price in ((1, -99.5, "3.400"), (2, -98.5, "3.000"), (3, -97.5, "3.200")):
+            create_station(pk, 32.01, longitude, price)
+
+        StationSnapshot.invalidate()
+        get_plan_cache().clear()
+        get_projection_cache().clear()
+
+        self.addCleanup(StationSnapshot.invalidate)
+        self.addCleanup(get_plan_cache().clear)
+        self.addCleanup(get_projection_cache().clear)
+
+        patcher = mock.patch("route.services.ors_service.ORSService.get_route", return_value=straight_route())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, path="/api/optimize-route/", **extra):
+        return self.client.post(path, self.PLAN, content_type="application/json", **extra)
+
+    def test_delta_polyline_decodes_to_the_same_points(self):
+        import polyline
+
+        for encoded in (straight_route()["polyline"], polyline.encode([(0.0, 0.0), (-33.86882, 151.20929), (64.1466, -21.9426)])):
+            with self.subTest(encoded=encoded[:20]):
+                self.assertEqual(decode_route_points(delta_encode_polyline(encoded)), polyline.decode(encoded))
+
+    def test_columnar_stops(self):
+        stops = [{"station_name": "A", "eta": None}, {"station_name": "B", "eta": "2026-10-19T12:00:00"}]
+
+        self.assertEqual(columnar_stops(stops), {
+            "fields": ["station_name", "eta"],
+            "columns": [["A", "B"], [None, "2026-10-19T12:00:00"]],
+        })
+        self.assertEqual(columnar_stops([]), {"fields": [], "columns": []})
+
+    def test_accept_header_and_format_parameter(self):
+        import msgpack
+
+        plan = self.post().json()
+
+        for response in (self.post(HTTP_ACCEPT="application/msgpack"), self.post("/api/optimize-route/?format=msgpack")):
+            self.assertEqual(response["Content-Type"], "application/msgpack")
+            document = msgpack.unpackb(response.content)
+
+            self.assertEqual(document["total_fuel_cost"], plan["total_fuel_cost"])
+            self.assertEqual(document["route_polyline"], plan["route_polyline"])
+
+            stops = document["fuel_stops"]
+            self.assertEqual(stops["fields"], list(plan["fuel_stops"][0]))
+            self.assertEqual(
+                [dict(zip(stops["fields"], row)) for row in zip(*stops["columns"])],
+                plan["fuel_stops"]
+            )
+
+    def test_delta_polyline_parameter(self):
+        import msgpack
+        import polyline
+
+        response = self.post("/api/optimize-route/?format=msgpack&polyline=delta")
+        document = msgpack.unpackb(response.content)
+
+        self.assertNotIn("route_polyline", document)
+        self.assertEqual(decode_route_points(document["route_points"]), polyline.decode(straight_route()["polyline"]))
+
+    def test_errors_pass_through(self):
+        import msgpack
+
+        response = self.client.post(
+            "/api/optimize-route/?format=msgpack", {"start_location": "Dallas, TX"}, content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("end_location", msgpack.unpackb(response.content))
+
+
+class NearestStationTests(TestCase):
+
+    def setUp(self):
+        create_station(1, 32.0, -97.0, "3.500")
+        create_station(2, 32.05, -97.0, "3.000")
+        create_station(3, 32.1, -97.0, "3.200", truck_accessible=False)
+        create_station(4, 33.0, -97.0, "2.500")
+
+        StationSnapshot.invalidate()
+        self.addCleanup(StationSnapshot.invalidate)
+
+    def nearest(self, **params):
+        response = self.client.get("/api/stations/nearest/", {"lat": 32.0, "lon": -97.0, **params})
+        self.assertEqual(response.status_code, 200)
+        return [station["id"] for station in response.json()["results"]]
+
+    def test_cheapest_within_radius(self):
+        self.assertEqual(self.nearest(radius_miles=10), [2, 3, 1])
+        self.assertEqual(self.nearest(radius_miles=100), [4, 2, 3, 1])
+
+    def test_limit(self):
+        self.assertEqual(self.nearest(radius_miles=10, limit=2), [2, 3])
+
+    def test_truck_only(self):
+        self.assertEqual(self.nearest(radius_miles=10, truck_only="true"), [2, 1])
+
+    def test_result_fields(self):
+        response = self.client.get("/api/stations/nearest/", {"lat": 32.0, "lon": -97.0, "radius_miles": 5})
+        result = response.json()
+
+        self.assertEqual(result["count"], 2)
+        self.assertEqual(result["results"][0]["name"], "STATION #2")
+        self.assertEqual(result["results"][0]["price_per_gallon"], 3.0)
+        self.assertAlmostEqual(result["results"][0]["distance_miles"], 3.45, places=1)
+
+    def test_invalid_params(self):
+        for params in (
+            {"lon": -97.0},
+            {"lat": 95, "lon": -97.0},
+            {"lat": 32.0, "lon": "west"},
+            {"lat": 32.0, "lon": -97.0, "radius_miles": 500},
+            {"lat": 32.0, "lon": -97.0, "limit": 0},
+            {"lat": 32.0, "lon": -97.0, "truck_only": "sometimes"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/api/stations/nearest/", params).status_code, 400)
+
+
+class ExportTests(TestCase):
+
+    def read_csv(self, response):
+        import csv
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+
+        return list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+
+    def test_station_export(self):
+        from route.services.export_service import ExportService
+
+        create_station(2, 32.0, -97.0, "3.100")
+        create_station(1, 33.4, -112.0, "3.200", state="AZ")
+
+        rows = self.read_csv(self.client.get("/api/stations/export/"))
+
+        self.assertEqual(rows[0], list(ExportService.STATION_COLUMNS))
+        self.assertEqual([row[0] for row in rows[1:]], ["1", "2"])
+
+        rows = self.read_csv(self.client.get("/api/stations/export/", {"state": "TX"}))
+        self.assertEqual([row[0] for row in rows[1:]], ["2"])
+
+    def test_plan_export_has_one_row_per_stop(self):
+        from route.services.export_service import ExportService
+
+        station = create_station(1, 32.0, -97.0)
+
+        def create_plan(summary=None):
+            return RouteRequest.objects.create(
+                start_location="Dallas, TX", end_location="Austin, TX", total_distance_miles=195.0,
+                total_fuel_cost=Decimal("31.00"), fuel_stop_summary=summary
+            )
+
+        with_stops = create_plan()
+        for order in (1, 2):
+            FuelStop.objects.create(
+                route=with_stops, station=station, stop_order=order, miles_from_start=order * 60.0,
+                gallons_filled=5.0, cost=Decimal("15.50")
+            )
+        without_stops = create_plan()
+        pruned = create_plan({"stops": 2, "gallons_filled": 10.0, "cost": 31.0})
+
+        rows = self.read_csv(self.client.get("/api/plans/export/"))
+        columns = list(ExportService.PLAN_COLUMNS)
+        stop_columns = columns[columns.index("stop_order"):]
+
+        self.assertEqual(rows[0], columns)
+        self.assertEqual(
+            [(row[0], row[columns.index("stop_order")]) for row in rows[1:]],
+            [(str(with_stops.pk), "1"), (str(with_stops.pk), "2"), (str(without_stops.pk), ""), (str(pruned.pk), "")]
+        )
+
+        for row in rows[3:]:
+            self.assertEqual(row[len(columns) - len(stop_columns):], [""] * len(stop_columns))
+
+        self.assertEqual(
+            json.loads(rows[4][columns.index("fuel_stop_summary")]),
+            {"stops": 2, "gallons_filled": 10.0, "cost": 31.0}
+        )
+
+
+class GeohashTests(SimpleTestCase):
+
+    def test_matches_the_standard_encoding(self):
+        cell = geo.geohash_cell(57.64911, 10.40744, 11)
+        self.assertEqual(geo.geohash_from_cell(*cell, 11), "u4pruydqqvj")
+
+        self.assertEqual(geo.geohash_from_cell(*geo.geohash_cell(-90.0, -180.0, 3), 3), "000")
+        self.assertEqual(geo.geohash_from_cell(*geo.geohash_cell(90.0, 180.0, 3), 3), "zzz")
+
+    def test_round_trip(self):
+        import random
+
+        rng = random.Random(0)
+
+        for precision in (1, 2, 3, 4, 6):
+            for _ in range(200):
+                latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+                cell = geo.geohash_cell(latitude, longitude, precision)
+                geohash = geo.geohash_from_cell(*cell, precision)
+
+                self.assertEqual(len(geohash), precision)
+                self.assertEqual(geo.geohash_to_cell(geohash), cell)
+
+                min_lat, max_lat, min_lon, max_lon = geo.geohash_bounds(geohash)
+                self.assertTrue(min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon)
+
+    def test_corridor_covers_every_point_within_distance(self):
+        import random
+
+        rng = random.Random(0)
+        route = straight_route(start=(31.0, -101.0), end=(34.0, -95.0))["decoded_points"]
+        tiles = geo.corridor_geohashes(route, 20, 3)
+
+        for _ in range(500):
+            lat, lon = rng.choice(route)
+            point = (lat + rng.uniform(-0.3, 0.3), lon + rng.uniform(-0.3, 0.3))
+
+            if min(geo.haversine(*point, *route_point) for route_point in route[::5]) <= 19:
+                self.assertIn(geo.geohash_from_cell(*geo.geohash_cell(*point, 3), 3), tiles)
+
+
+class ShardedPlanningTests(TestCase):
+
+    def setUp(self):
+        import random
+
+        rng = random.Random(0)
+        self.route = straight_route(start=(31.0, -101.0), end=(34.0, -95.0), steps=600)
+
+        # Stations around a route crossing several tiles, plus far-away ones
+        for pk in range(1, 301):
+            lat, lon = rng.choice(self.route["decoded_points"])
+            if pk % 10 == 0:
+                lat, lon = lat + rng.uniform(2, 4), lon - rng.uniform(2, 4)
+
+            kind = rng.random()
+            create_station(
+                pk, lat + rng.gauss(0, 0.2), lon + rng.gauss(0, 0.2), f"{rng.uniform(3.0, 4.5):.3f}",
+                truck_accessible=kind > 0.1,
+                opens_at=clock(6) if kind > 0.8 else None,
+                closes_at=clock(22) if kind > 0.8 else None,
+            )
+
+        for cleanup in (StationSnapshot.invalidate, StationShardMap.invalidate):
+            cleanup()
+            self.addCleanup(cleanup)
+
+    def plan(self, sharding):
+        StationSnapshot.invalidate()
+        StationShardMap.invalidate()
+
+        with override_settings(ROUTE_STATION_SHARDING=sharding):
+            projected = RouteOptimizationService.get_projected_stations(self.route["decoded_points"])
+            eta_at = RouteOptimizationService.build_eta(
+                self.route["legs"], datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+            )
+
+            plans = [
+                RouteOptimizationService.calculate_realistic_stops(
+                    self.route["distance_miles"], mpg, tank, tank / 2, projected_stations=projected,
+                    required_attributes=required, eta_at=eta, alternatives=2
+                )
+                for mpg, tank in ((10, 10), (6.5, 30))
+                for required in (0, 1)
+                for eta in (None, eta_at)
+            ]
+
+            from route.services.station_shards import get_corridor_stations
+
+            nearest = [
+                [
+                    (round(distance, 6), station.pk)
+                    for distance, station in get_corridor_stations([(lat, lon)], 30).cheapest_within(
+                        lat, lon, 30, 10, required_attributes=required
+                    )
+                ]
+                for lat, lon in self.route["decoded_points"][::60]
+                for required in (0, 1)
+            ]
+
+            if sharding:
+                # The route crosses several tiles, and skips some
+                stats = StationShardMap.current().stats()
+                self.assertGreater(stats["loaded_tiles"], 1)
+                self.assertLess(stats["loaded_tiles"], stats["tiles"])
+
+        return plans, nearest
+
+    def test_sharded_plans_are_identical(self):
+        sharded_plans, sharded_nearest = self.plan(sharding=True)
+        plans, nearest = self.plan(sharding=False)
+
+        self.assertTrue(all(stops for stops, _, _, _ in plans))
+        self.assertEqual(sharded_plans, plans)
+        self.assertEqual(sharded_nearest, nearest)
+        self.assertTrue(any(nearest))
+
+
+class WaypointRouteTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        for pk, longitude, price in ((1, -99.5, "3.400"), (2, -98.5, "3.000"), (3, -97.5, "3.200")):
+            create_station(pk, 32.01, longitude, price)
+
+        for cleanup in (StationSnapshot.invalidate, get_plan_cache().clear, get_projection_cache().clear, cache.clear):
+            cleanup()
+            self.addCleanup(cleanup)
+
+    def route_with_waypoint(self):
+        """
+        straight_route() split into two legs at its middle point.
+        """
+        route = straight_route()
+        first = RouteOptimizationService.get_cumulative_distances(route["decoded_points"][:151])[-1]
+        second = route["distance_miles"] - first
+
+        return {**route, "legs": [
+            {"distance_miles": first, "duration_seconds": first * 60},
+            {"distance_miles": second, "duration_seconds": second * 60},
+        ]}
+
+    def test_one_osrm_call_through_every_location(self):
+        coordinates = {"Abilene, TX": (32.0, -100.0), "Stephenville, TX": (32.0, -98.5), "Fort Worth, TX": (32.0, -97.0)}
+        osrm_response = mock.Mock(status_code=200)
+        osrm_response.json.return_value = {"routes": [{
+            "distance": 280000, "duration": 10000, "geometry": straight_route()["polyline"],
+            "legs": [{"distance": 140000, "duration": 5200}, {"distance": 140000, "duration": 4800}],
+        }]}
+        osrm = mock.Mock(get=mock.Mock(return_value=osrm_response))
+
+        with mock.patch.object(ORSService, "geocode_location", side_effect=lambda location, priority: coordinates[location]), \
+                mock.patch("route.services.ors_service.get_client", return_value=osrm), \
+                mock.patch("route.services.ors_service.connections.close_all") as close_all:
+            route = ORSService.get_route("Abilene, TX", "Fort Worth, TX", waypoints=["Stephenville, TX"])
+
+        osrm.get.assert_called_once()
+        self.assertEqual(osrm.get.call_args[0][0], f"{ORSService.OSRM_ROUTE_URL}/-100.0,32.0;-98.5,32.0;-97.0,32.0")
+        self.assertEqual([leg["duration_seconds"] for leg in route["legs"]], [5200, 4800])
+        self.assertAlmostEqual(route["legs"][0]["distance_miles"], 140000 * ORSService.METERS_TO_MILES)
+
+        # Each geocoding thread closed its database connections
+        self.assertEqual(close_all.call_count, 3)
+
+    def test_waypoint_markers_and_etas(self):
+        route = self.route_with_waypoint()
+        departure = datetime(2026, 10, 19, 8, tzinfo=timezone.utc)
+
+        with mock.patch.object(ORSService, "get_route", return_value=route):
+            result = RoutePlanningService.plan_route(
+                "Abilene, TX", "Fort Worth, TX", 10, 10, 10, departure_time=departure, waypoints=["Stephenville, TX"]
+            )
+
+        first = route["legs"][0]
+        self.assertEqual(result["waypoints"], [{
+            "location": "Stephenville, TX",
+            "miles_from_start": round(first["distance_miles"], 2),
+            "eta": (departure + timedelta(seconds=first["duration_seconds"])).isoformat(),
+        }])
+        self.assertEqual(
+            result["arrival_time"],
+            (departure + timedelta(seconds=route["distance_miles"] * 60)).isoformat()
+        )
+
+    def test_tank_state_carries_across_waypoints(self):
+        route = self.route_with_waypoint()
+
+        with mock.patch.object(ORSService, "get_route", return_value=route):
+            through = RoutePlanningService.plan_route(
+                "Abilene, TX", "Fort Worth, TX", 10, 10, 10, waypoints=["Stephenville, TX"]
+            )
+
+        with mock.patch.object(ORSService, "get_route", return_value=straight_route()):
+            direct = RoutePlanningService.plan_route("Abilene, TX", "Fort Worth, TX", 10, 10, 10)
+
+        # ~176 miles on a 100 mile tank: one stop for the whole trip, not per leg
+        self.assertEqual(through["total_stops"], 1)
+        self.assertEqual(through["fuel_stops"], direct["fuel_stops"])
+        self.assertEqual(through["fuel_remaining_at_destination"], direct["fuel_remaining_at_destination"])
@@ -1,7 +1,23 @@
 # route/urls.py
 from django.urls import path
-from route.views import RouteOptimizationAPIView
+from route.views import (
+    MetricsAPIView,
+    NearestStationAPIView,
+    PlanExportAPIView,
+    PlanListAPIView,
+    ReplanRouteAPIView,
+    RouteOptimizationAPIView,
+    StationExportAPIView,
+    StationListAPIView,
+)
 
 urlpatterns = [
     path('optimize-route/', RouteOptimizationAPIView.as_view(), name='optimize-route'),
+    path('replan-route/', ReplanRouteAPIView.as_view(), name='replan-route'),
+    path('metrics/', MetricsAPIView.as_view(), name='metrics'),
+    path('stations/', StationListAPIView.as_view(), name='station-list'),
+    path('stations/nearest/', NearestStationAPIView.as_view(), name='station-nearest'),
+    path('stations/export/', StationExportAPIView.as_view(), name='station-export'),
+    path('plans/', PlanListAPIView.as_view(), name='plan-list'),
+    path('plans/export/', PlanExportAPIView.as_view(), name='plan-export'),
 ]
\ No newline at end of file
@@ -1,16 +1,37 @@
-import hashlib
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from rest_framework.generics import ListAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.settings import api_settings
 
-from route.models import RouteRequest
-from route.serializers import RouteOptimizationSerializer
-from route.services.ors_service import ORSService
-from route.services.optimization_service import RouteOptimizationService
+from route.models import FuelStation, FuelStop, RouteRequest
+from route.pagination import KeysetPagination, NewestFirstPagination
+from route.renderers import MessagePackRenderer
+from route.serializers import (
+    FuelStationSerializer,
+    NearestStationQuerySerializer,
+    ReplanSerializer,
+    RouteOptimizationSerializer,
+    StationFilterSerializer,
+    StoredPlanSerializer,
+)
+from route.services.coalescing import route_plans
+from route.services.export_service import ExportService
+from route.services.plan_cache import get_plan_cache, get_projection_cache
+from route.services.planning_service import RoutePlanningService
+from route.services.resilience import get_upstream_status
+from route.services.station_shards import StationShardMap, get_corridor_stations, sharding_enabled
+from route.services.station_snapshot import ATTR_TRUCK_ACCESSIBLE
+from route.services.warmup import warmup_report
 
 
 class RouteOptimizationAPIView(APIView):
 
+    # JSON by default; machine clients can ask for application/msgpack
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer]
+
     def post(self, request):
         serializer = RouteOptimizationSerializer(data=request.data)
 
@@ -24,6 +45,12 @@ class RouteOptimizationAPIView(APIView):
         tank_capacity = serializer.validated_data.get("tank_capacity", 50)
         initial_fuel = serializer.validated_data.get("initial_fuel", tank_capacity)
 
+        departure_time = serializer.validated_data.get("departure_time")
+        require_truck_access = serializer.validated_data.get("require_truck_access", True)
+        waypoints = serializer.validated_data.get("waypoints", [])
+        allow_approximate = serializer.validated_data.get("allow_approximate", False)
+        alternatives = serializer.validated_data.get("alternatives", 0)
+
         if initial_fuel <= 0:
             return Response(
                 {"error": "Vehicle cannot start with zero fuel."},
@@ -31,31 +58,24 @@ class RouteOptimizationAPIView(APIView):
             )
 
         try:
-            route_data = ORSService.get_route(start_location, end_location)
-            total_distance = route_data["distance_miles"]
-
-            stops, total_cost, total_fuel_used, fuel_remaining = \
-                RouteOptimizationService.calculate_realistic_stops(
-                    total_distance=total_distance,
-                    mpg=mpg,
-                    tank_capacity=tank_capacity,
-                    initial_fuel=initial_fuel,
-                    route_points=route_data["decoded_points"]
+            # Identical in-flight requests share a single computation
+            result = route_plans.do(
+                RoutePlanningService.get_request_key(
+                    start_location, end_location, mpg, tank_capacity, initial_fuel,
+                    departure_time, require_truck_access, waypoints, allow_approximate,
+                    alternatives
+                ),
+                lambda: RoutePlanningService.plan_route(
+                    start_location, end_location, mpg, tank_capacity, initial_fuel,
+                    departure_time, require_truck_access, waypoints, allow_approximate,
+                    alternatives
                 )
+            )
 
             return Response({
+                **result,
                 "start_location": start_location,
-                "end_location": end_location,
-                "total_distance_miles": round(total_distance, 2),
-                "total_stops": len(stops),
-                "vehicle_mpg": mpg,
-                "tank_capacity": tank_capacity,
-                "initial_fuel": initial_fuel,
-                "total_fuel_used": round(float(total_fuel_used), 2),
-                "total_fuel_cost": round(float(total_cost), 2),
-                "fuel_remaining_at_destination": round(float(fuel_remaining), 2),
-                "fuel_stops": stops,
-                "route_polyline": route_data["polyline"]
+                "end_location": end_location
             }, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -74,6 +94,11 @@ class RouteOptimizationAPIView(APIView):
             "status": "operational",
             "endpoint": "/api/optimize-route/",
             "method": "POST",
+            "response_formats": {
+                "application/json": "Default",
+                "application/msgpack": "MessagePack with columnar fuel_stops; "
+                                       "add ?polyline=delta for integer route_points"
+            },
             "parameters": {
                 "required": {
                     "start_location": "string - Starting city/address (e.g., 'Dallas, Texas')",
@@ -82,7 +107,12 @@ class RouteOptimizationAPIView(APIView):
                 "optional": {
                     "vehicle_mpg": "float - Miles per gallon (default: 10)",
                     "tank_capacity": "float - Tank capacity in gallons (default: 50)",
-                    "initial_fuel": "float - Starting fuel in gallons (default: tank_capacity)"
+                    "initial_fuel": "float - Starting fuel in gallons (default: tank_capacity)",
+                    "waypoints": "list of strings - Ordered stops between start and end (max 10)",
+                    "departure_time": "ISO 8601 datetime - Enables ETAs and skips stations closed on arrival",
+                    "require_truck_access": "bool - Only stop at truck-accessible stations (default: true)",
+                    "allow_approximate": "bool - Plan for the vehicle profile snapped down to its bucket (0.5 mpg, 5 gal), shared with near-identical requests (default: false)",
+                    "alternatives": "int - Runner-up stations to list per stop, 0-10 (default: 0)"
                 }
             },
             "response_fields": {
@@ -97,7 +127,11 @@ class RouteOptimizationAPIView(APIView):
                 "total_fuel_cost": "Total cost of fuel",
                 "fuel_remaining_at_destination": "Fuel left at destination",
                 "fuel_stops": "Array of fuel stop details",
-                "route_polyline": "Encoded route polyline for mapping"
+                "route_polyline": "Encoded route polyline for mapping",
+                "approximate": "True when the plan is for the bucketed vehicle profile (only with allow_approximate)",
+                "waypoints": "Each waypoint's miles_from_start (and eta) (only with waypoints)",
+                "departure_time": "Departure time (only with departure_time)",
+                "arrival_time": "Estimated arrival time (only with departure_time)"
             },
             "example_request": {
                 "start_location": "Dallas, Texas",
@@ -122,6 +156,216 @@ class RouteOptimizationAPIView(APIView):
                 "fuel_after_refill": "Fuel level after refueling",
                 "segment_cost": "Cost of this refuel",
                 "cumulative_cost": "Total cost up to this stop",
-                "distance_from_route_miles": "Station's distance from route"
+                "distance_from_route_miles": "Station's distance from route",
+                "eta": "Estimated arrival time at the station (only with departure_time)",
+                "alternatives": "Runner-up stations from the same reachable window, cheapest first, "
+                                "with price_delta_per_gallon and cost_delta for the same gallons "
+                                "(only with alternatives)"
+            },
+            "replanning": {
+                "endpoint": "/api/replan-route/",
+                "method": "POST",
+                "parameters": "Same as above except initial_fuel and allow_approximate, plus "
+                              "current_mile and current_fuel (required). Reuses the route and "
+                              "station projection cached by the original request."
             }
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+
+class ReplanRouteAPIView(APIView):
+
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer]
+
+    def post(self, request):
+        """
+        Replan the rest of a trip from the vehicle's current mile marker
+        and fuel level
+        """
+        serializer = ReplanSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+
+        if data["current_fuel"] <= 0:
+            return Response(
+                {"error": "Vehicle cannot continue with zero fuel."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            result = RoutePlanningService.replan_route(
+                data["start_location"],
+                data["end_location"],
+                data.get("vehicle_mpg", 10),
+                data.get("tank_capacity", 50),
+                data["current_mile"],
+                data["current_fuel"],
+                departure_time=data.get("departure_time"),
+                require_truck_access=data.get("require_truck_access", True),
+                waypoints=data.get("waypoints", []),
+                alternatives=data.get("alternatives", 0)
+            )
+
+            return Response(result, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class MetricsAPIView(APIView):
+
+    def get(self, request):
+        """
+        Operational metrics: outbound upstream health, rate-limit queues,
+        planner cache efficiency, start-up warm-up cost and, with station
+        sharding, the tiles loaded by this worker
+        """
+        return Response({
+            "outbound": get_upstream_status(),
+            "plan_cache": get_plan_cache().stats(),
+            "projection_cache": get_projection_cache().stats(),
+            "station_shards": StationShardMap.current().stats() if sharding_enabled() else None,
+            "warmup": warmup_report
+        }, status=status.HTTP_200_OK)
+
+
+def filter_stations(query_params):
+    """
+    Stations matching the state / is_geocoded / price query parameters.
+    """
+    filters = StationFilterSerializer(data=query_params)
+    filters.is_valid(raise_exception=True)
+    params = filters.validated_data
+
+    queryset = FuelStation.objects.all()
+
+    if params.get("is_geocoded") is not None:
+        queryset = queryset.filter(is_geocoded=params["is_geocoded"])
+    if "state" in params:
+        queryset = queryset.filter(state=params["state"])
+    if "min_price" in params:
+        queryset = queryset.filter(retail_price__gte=params["min_price"])
+    if "max_price" in params:
+        queryset = queryset.filter(retail_price__lte=params["max_price"])
+
+    return queryset
+
+
+def plans_queryset(query_params):
+    queryset = RouteRequest.objects.all()
+
+    route_hash = query_params.get("route_hash")
+    if route_hash:
+        queryset = queryset.filter(route_hash=route_hash)
+
+    return queryset
+
+
+def csv_response(filename, header, rows):
+    response = StreamingHttpResponse(
+        ExportService.stream_csv(header, rows),
+        content_type="text/csv"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+class StationListAPIView(ListAPIView):
+    """
+    Fuel stations by id, keyset-paginated. Filters: state, is_geocoded,
+    min_price, max_price.
+    """
+    serializer_class = FuelStationSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return filter_stations(self.request.query_params)
+
+
+class PlanListAPIView(ListAPIView):
+    """
+    Stored route plans with their fuel stops, newest first, keyset-paginated.
+    Stops and their stations are loaded in one extra query per page.
+    """
+    serializer_class = StoredPlanSerializer
+    pagination_class = NewestFirstPagination
+
+    def get_queryset(self):
+        return plans_queryset(self.request.query_params).select_related("geometry").prefetch_related(
+            Prefetch(
+                "fuel_stops",
+                queryset=FuelStop.objects.select_related("station").order_by("stop_order")
+            )
+        )
+
+
+class NearestStationAPIView(APIView):
+
+    def get(self, request):
+        """
+        Cheapest geocoded stations within radius_miles of (lat, lon),
+        served from the in-memory station snapshot (or the station tiles
+        around the point, with sharding)
+        """
+        query = NearestStationQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        nearest = get_corridor_stations(
+            [(params["lat"], params["lon"])], params["radius_miles"]
+        ).cheapest_within(
+            params["lat"],
+            params["lon"],
+            params["radius_miles"],
+            params["limit"],
+            required_attributes=ATTR_TRUCK_ACCESSIBLE if params["truck_only"] else 0
+        )
+
+        return Response({
+            "count": len(nearest),
+            "results": [
+                {
+                    "id": station.pk,
+                    "name": station.name,
+                    "city": station.city,
+                    "state": station.state,
+                    "price_per_gallon": float(station.retail_price),
+                    "latitude": station.latitude,
+                    "longitude": station.longitude,
+                    "truck_accessible": station.truck_accessible,
+                    "distance_miles": round(distance, 2),
+                }
+                for distance, station in nearest
+            ]
+        }, status=status.HTTP_200_OK)
+
+
+class StationExportAPIView(APIView):
+
+    def get(self, request):
+        """
+        Stream matching stations as CSV (same filters as the station list)
+        """
+        return csv_response(
+            "stations.csv",
+            ExportService.STATION_COLUMNS,
+            ExportService.station_rows(filter_stations(request.query_params))
+        )
+
+
+class PlanExportAPIView(APIView):
+
+    def get(self, request):
+        """
+        Stream stored plans as CSV, one row per fuel stop
+        """
+        return csv_response(
+            "plans.csv",
+            ExportService.PLAN_COLUMNS,
+            ExportService.plan_rows(plans_queryset(request.query_params))
+        )
@@ -123,3 +123,108 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Route planning
+# Geocoded stations are kept in memory per process; the snapshot version is
+# re-checked against the database at most once per STATION_SNAPSHOT_TTL seconds.
+STATION_SNAPSHOT_TTL = 60
+
+# Station-to-route projection for long routes can be split across a process
+# pool. Routes with fewer points than the threshold stay in-process; fewer
+# than two workers disables the pool.
+ROUTE_PROJECTION_WORKERS = int(os.environ.get("ROUTE_PROJECTION_WORKERS", "0"))
+ROUTE_PROJECTION_PARALLEL_THRESHOLD = 20000
+
+# Identical in-flight route requests are coalesced into one computation per
+# process. Enable CROSS_PROCESS to also coordinate workers through the given
+# cache alias (use a database cache for that).
+ROUTE_COALESCE_CROSS_PROCESS = False
+ROUTE_COALESCE_CACHE = "default"
+ROUTE_COALESCE_LOCK_TIMEOUT = 30
+ROUTE_COALESCE_RESULT_TTL = 5
+
+# Outbound calls (see route/services/resilience.py). Timeouts adapt to
+# observed latency within [min_timeout, max_timeout]; the circuit opens after
+# failure_threshold consecutive failures and retries after reset_timeout
+# seconds. Hedging sends a duplicate request when the first one is slow, so
+# keep it off for rate-limited upstreams like Nominatim.
+# rate_limit (requests/second) is enforced across all worker processes on the
+# host through OUTBOUND_RATE_LIMIT_DB; interactive requests go ahead of
+# background jobs and give up after max_queue_wait seconds.
+OUTBOUND_RATE_LIMIT_DB = BASE_DIR / "outbound_ratelimit.sqlite3"
+
+OUTBOUND_UPSTREAMS = {
+    "nominatim": {
+        "min_timeout": 2,
+        "max_timeout": 15,
+        "retries": 1,
+        "hedge": False,
+        "failure_threshold": 5,
+        "reset_timeout": 30,
+        "rate_limit": 1,  # Nominatim usage policy
+        "burst": 1,
+        "max_queue_wait": 10,
+    },
+    "osrm": {
+        "min_timeout": 3,
+        "max_timeout": 20,
+        "retries": 1,
+        "hedge": False,
+        "failure_threshold": 5,
+        "reset_timeout": 30,
+    },
+}
+
+# Load the station snapshot and routing structures in AppConfig.ready() so
+# the first request is served warm. Set the environment variable for server
+# processes only (management commands do not need it). STATION_SNAPSHOT_PATH
+# is written by `manage.py build_station_snapshot`; without it the snapshot
+# is loaded from the database.
+ROUTE_WARMUP_ON_STARTUP = os.environ.get("ROUTE_WARMUP_ON_STARTUP") == "1"
+STATION_SNAPSHOT_PATH = BASE_DIR / "station_snapshot.pickle"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "route": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
+# Per-process memory budget for memoized fuel-stop plans (LRU by size)
+ROUTE_PLAN_CACHE_MAX_BYTES = int(os.environ.get("ROUTE_PLAN_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# `manage.py compact_route_history` keeps per-stop rows for this long; older
+# plans keep only a summary of their stops
+ROUTE_FUEL_STOP_RETENTION_DAYS = 180
+
+# Per-process memory budget for route geometry and station projections
+# (LRU by size), so replanning mid-trip skips routing and projection
+ROUTE_PROJECTION_CACHE_MAX_BYTES = int(
+    os.environ.get("ROUTE_PROJECTION_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+)
+
+# Stations kept per route point, attribute mask and opening-hours window when
+# projecting stations onto a route (the cheapest ones). Bounds memory on long
+# routes through dense areas. Stop choice is exact, with or without a
+# departure time; runner-up alternatives only look this deep (None keeps
+# every match).
+ROUTE_CANDIDATES_PER_POINT = 12
+
+# Peak memory allowed for planning one request, enforced for the long-route
+# fixtures by `python manage.py test` (see route.benchmarks.memory). Below
+# every fixture's unbounded peak, so the test fails if the bound is lost
+ROUTE_MEMORY_BUDGET_MB = 32
+
+# Geographic sharding of the station set (see route/services/station_shards.py).
+# When enabled, workers load only the geohash tiles (of the given precision;
+# 3 is ~1.4 degrees square) that their routes touch, keeping at most
+# ROUTE_STATION_SHARD_CACHE_SIZE tiles in memory, instead of every station.
+# Projection process pools need the full snapshot and are not used.
+ROUTE_STATION_SHARDING = os.environ.get("ROUTE_STATION_SHARDING") == "1"
+ROUTE_STATION_TILE_PRECISION = 3
+ROUTE_STATION_SHARD_CACHE_SIZE = 256